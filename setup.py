@@ -44,10 +44,11 @@ setup(
         'Operating System :: POSIX :: Linux',
         'Topic :: Utilities',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.3',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
     ],
+    python_requires='>=3.7',
     entry_points={
         'console_scripts': [
             'zenfig = zenfig.__main__:main',
@@ -56,4 +57,8 @@ setup(
     tests_require = ['nose >= 1.3'],
     test_suite="nose.collector",
     install_requires = reqs,
+    extras_require={
+        # .tar.zst kits
+        'zst': ['zstandard'],
+    },
 )
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+"""
+Helpers shared by tests
+"""
+
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def setenv(**env_vars):
+    """
+    Set environment variables for a while
+
+    Whatever these variables were set to (if anything)
+    is put back afterwards.
+    """
+
+    old_env_vars = {name: os.environ.get(name) for name in env_vars}
+    os.environ.update(env_vars)
+    try:
+        yield
+    finally:
+        for name, value in old_env_vars.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
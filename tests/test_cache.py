@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test for: persistent caches
+"""
+
+import os
+import tempfile
+
+from nose.tools import raises, eq_, ok_, assert_raises
+from helpers import setenv
+from zenfig import cache
+
+
+def test_cache_load_store():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with setenv(XDG_CACHE_HOME=tmp_dir):
+            # nothing has been stored yet
+            eq_(cache.load(cache.CACHE_VARS, 'slot', 'key'), None)
+
+            # entries are only given back with the key they were stored with
+            cache.store(cache.CACHE_VARS, 'slot', 'key', {'hello': 'world'})
+            eq_(cache.load(cache.CACHE_VARS, 'slot', 'key'), {'hello': 'world'})
+            eq_(cache.load(cache.CACHE_VARS, 'slot', 'another_key'), None)
+
+            # and they go away on purge
+            eq_(cache.get_cache_info(cache.CACHE_VARS)[0], 1)
+            cache.purge(cache.CACHE_VARS)
+            eq_(cache.load(cache.CACHE_VARS, 'slot', 'key'), None)
+
+
+def test_cache_file_fingerprint():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        var_file = os.path.join(tmp_dir, 'vars.yml')
+        eq_(cache.get_file_fingerprint(var_file), (var_file,))
+
+        with open(var_file, 'w') as f:
+            f.write("hello: world")
+        fingerprint = cache.get_file_fingerprint(var_file)
+
+        with open(var_file, 'w') as f:
+            f.write("hello: there")
+        ok_(fingerprint != cache.get_file_fingerprint(var_file))
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test for: dependency graph
+"""
+
+import pickle
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from nose.tools import raises, eq_, ok_, assert_raises
+from zenfig.depgraph import DepGraphException
+from zenfig.depgraph.depgraph import DepGraph
+from zenfig.depgraph.node import Node
+
+
+class SumNode(Node):
+    """Nodes whose values are lists of keys from other nodes"""
+
+    evaluations = 0
+
+    def calc_deps(self):
+        return self.value
+
+    def on_evaluate(self):
+        SumNode.evaluations += 1
+        return 1 + sum(dep.value for dep in self.deps.values())
+
+
+def test_depgraph_deep_chain():
+    # way deeper than the recursion limit
+    depth = 10000
+    nodes = {'n{}'.format(i): ['n{}'.format(i + 1)] for i in range(depth)}
+    nodes['n{}'.format(depth)] = []
+
+    SumNode.evaluations = 0
+    r = DepGraph(node_class=SumNode, **nodes).evaluate()
+    eq_(r['n0'], depth + 1)
+    eq_(r['n{}'.format(depth)], 1)
+
+    # each node is evaluated exactly once
+    eq_(SumNode.evaluations, depth + 1)
+
+
+def test_depgraph_wide():
+    nodes = {'n{}'.format(i): ['base'] for i in range(100000)}
+    nodes['base'] = []
+    r = DepGraph(node_class=SumNode, **nodes).evaluate()
+    eq_(r['n99999'], 2)
+
+
+def test_depgraph_cycles():
+    nodes = {
+        'a': ['b'],
+        'b': ['a'],
+        'c': ['c'],
+        'd': ['e'],
+        'e': [],
+    }
+    try:
+        DepGraph(node_class=SumNode, **nodes).evaluate()
+    except DepGraphException as exc:
+        # all cycles are reported at once
+        ok_('a ~> b ~> a' in str(exc) or 'b ~> a ~> b' in str(exc))
+        ok_('c ~> c' in str(exc))
+        ok_('d ~>' not in str(exc))
+    else:
+        ok_(False, "circular dependencies were not detected")
+
+
+def test_depgraph_node_evaluate():
+    graph = DepGraph(node_class=SumNode, a=['b'], b=['c'], c=[], d=['a'])
+
+    # a single node gets evaluated along with its dependencies only
+    SumNode.evaluations = 0
+    eq_(graph.get_node('a').evaluate(), 3)
+    eq_(SumNode.evaluations, 3)
+
+
+def test_depgraph_levels():
+    graph = DepGraph(node_class=SumNode, a=['b', 'c'], b=['c'], c=[], d=[])
+    levels = graph._get_levels(graph._sort(graph._nodes.values()))
+    eq_([sorted(node.key for node in level) for level in levels],
+        [['c', 'd'], ['b'], ['a']])
+
+
+def test_depgraph_node_pickle():
+    graph = DepGraph(node_class=SumNode, a=['b'], b=['c'], c=[])
+    graph.get_node('c').evaluate()
+    graph.get_node('b').evaluate()
+
+    # nodes travel detached from their graph,
+    # along with their dependencies' values
+    node = pickle.loads(pickle.dumps(graph.get_node('a')))
+    eq_(node._depgraph, None)
+    eq_(list(node.deps), ['b'])
+    eq_(node.deps['b'].value, 2)
+    eq_(node.deps['b'].deps, {})
+    eq_(node.resolve(), 3)
+
+
+def test_depgraph_executor():
+    nodes = {'n{}'.format(i): ['n{}'.format(i // 2)] for i in range(1, 1000)}
+    nodes['n0'] = []
+    expected = DepGraph(node_class=SumNode, **nodes).evaluate()
+
+    # results don't depend on how nodes are evaluated
+    for executor_class in [ThreadPoolExecutor, ProcessPoolExecutor]:
+        with executor_class(max_workers=3) as executor:
+            r = DepGraph(node_class=SumNode, **nodes).evaluate(executor=executor)
+        eq_(r, expected)
+
+
+class _CountingExecutor(ThreadPoolExecutor):
+    """Executor keeping track of how many nodes it gets"""
+
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.nodes = 0
+
+    def map(self, func, nodes, **kwargs):
+        nodes = list(nodes)
+        self.nodes += len(nodes)
+        return super().map(func, nodes, **kwargs)
+
+
+def test_depgraph_executor_small_levels():
+    nodes = {'n{}'.format(i): ['n0'] for i in range(1, 10)}
+    nodes['n0'] = []
+    expected = DepGraph(node_class=SumNode, **nodes).evaluate()
+
+    # small levels are evaluated in place ...
+    with _CountingExecutor() as executor:
+        r = DepGraph(node_class=SumNode, **nodes).evaluate(executor=executor)
+    eq_(r, expected)
+    eq_(executor.nodes, 0)
+
+    # ... and so are nodes with no dependencies, no matter what
+    with _CountingExecutor() as executor:
+        r = DepGraph(node_class=SumNode, **nodes).evaluate(
+            executor=executor, executor_min_nodes=1
+        )
+    eq_(r, expected)
+    eq_(executor.nodes, 9)
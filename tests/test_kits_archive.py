@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test for: archive kit provider
+"""
+
+import io
+import os
+import tarfile
+import tempfile
+import zipfile
+
+from nose.tools import raises, eq_, ok_, assert_raises
+from helpers import setenv
+from zenfig import kit as zenfig_kit
+from zenfig import renderer
+from zenfig import variables
+from zenfig.kits import KitException
+from zenfig.kits import archive
+from zenfig.kits.archive import ArchiveKit
+
+KIT_FILES = {
+    'index.yml': (
+        "author: me\nname: hello\nversion: '1.0'\n"
+        "templates:\n  hello:\n    output_file: hello.conf\n"
+    ),
+    'defaults/vars.yml': "hello: world\n",
+    'templates/hello/main.j2': "{% include 'common.j2' %}{{ hello }}\n",
+    'templates/common.j2': "hello ",
+}
+
+
+def _create_tar_kit(path, prefix=''):
+    with tarfile.open(path, 'w:gz') as tar:
+        for name, content in KIT_FILES.items():
+            data = content.encode('utf-8')
+            tar_info = tarfile.TarInfo(prefix + name)
+            tar_info.size = len(data)
+            tar.addfile(tar_info, io.BytesIO(data))
+
+
+def _create_zip_kit(path, prefix=''):
+    with zipfile.ZipFile(path, 'w') as zip_file:
+        for name, content in KIT_FILES.items():
+            zip_file.writestr(prefix + name, content)
+
+
+def _check_kit(kit):
+    ok_(isinstance(kit, ArchiveKit))
+    eq_(kit.index_data['name'], 'hello')
+
+    # templates are loaded straight from the archive ...
+    template_data = kit.templates['hello']
+    tpl_env = renderer.create_template_env(template_data['include'])
+    eq_(
+        tpl_env.get_template(template_data['path']).render(hello='world'),
+        "hello world\n"
+    )
+
+    # ... and so are variables
+    tpl_vars, tpl_files = variables._get_vars(var_files=[kit.var_dir])
+    eq_(tpl_vars, {'hello': 'world'})
+    eq_(tpl_files['hello'], os.path.join(kit.var_dir, 'vars.yml'))
+
+
+def test_archive_kit():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with setenv(XDG_CACHE_HOME=tmp_dir):
+            tar_kit = os.path.join(tmp_dir, 'hello-1.0.tar.gz')
+            _create_tar_kit(tar_kit, prefix='hello-1.0/')
+            kit = zenfig_kit.get_kit(tar_kit)
+            eq_(kit.root_dir, os.path.join(tar_kit, 'hello-1.0'))
+            _check_kit(kit)
+
+            zip_kit = os.path.join(tmp_dir, 'hello.zip')
+            _create_zip_kit(zip_kit)
+            kit = zenfig_kit.get_kit(zip_kit)
+            eq_(kit.root_dir, zip_kit)
+            _check_kit(kit)
+
+            # nothing gets extracted
+            eq_(sorted(os.listdir(tmp_dir)), [
+                'hello-1.0.tar.gz', 'hello.zip', 'zenfig'
+            ])
+
+
+def test_archive_kit_changes():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with setenv(XDG_CACHE_HOME=tmp_dir):
+            tar_kit = os.path.join(tmp_dir, 'hello.tar.gz')
+            _create_tar_kit(tar_kit)
+            kit = zenfig_kit.get_kit(tar_kit)
+            template_data = kit.templates['hello']
+            tpl_env = renderer.create_template_env(template_data['include'])
+            eq_(
+                tpl_env.get_template(template_data['path']).render(hello='world'),
+                "hello world\n"
+            )
+
+            # templates (and their includes) are read again once the archive changes
+            KIT_FILES['templates/common.j2'] = "goodbye "
+            try:
+                _create_tar_kit(tar_kit)
+            finally:
+                KIT_FILES['templates/common.j2'] = "hello "
+            os.utime(tar_kit, (0, 0))
+            tpl_env = renderer.create_template_env(template_data['include'])
+            eq_(
+                tpl_env.get_template(template_data['path']).render(hello='world'),
+                "goodbye world\n"
+            )
+
+
+def test_archive_kit_split_path():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        zip_kit = os.path.join(tmp_dir, 'hello.zip')
+        _create_zip_kit(zip_kit)
+
+        kit_archive, member = archive.split_path(
+            os.path.join(zip_kit, 'templates', 'hello', 'main.j2')
+        )
+        eq_(kit_archive.path, zip_kit)
+        eq_(member, 'templates/hello/main.j2')
+        ok_(kit_archive.is_file(member))
+        ok_(kit_archive.is_dir('templates'))
+        eq_(kit_archive.list_files('templates'), ['templates/common.j2'])
+        eq_(archive.split_path(os.path.join(tmp_dir, 'hello.yml')), None)
+
+        # archives are indexed again once they change
+        with zipfile.ZipFile(zip_kit, 'a') as zip_file:
+            zip_file.writestr('templates/other.j2', 'other')
+        os.utime(zip_kit, (0, 0))
+        ok_(archive.get_archive(zip_kit).is_file('templates/other.j2'))
+
+
+def test_archive_kit_invalid():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        zip_kit = os.path.join(tmp_dir, 'empty.zip')
+        with zipfile.ZipFile(zip_kit, 'w') as zip_file:
+            zip_file.writestr('README', 'nothing to see here')
+        assert_raises(KitException, zenfig_kit.get_kit, zip_kit)
+
+
+def test_archive_kit_zst_missing():
+    zstandard = archive.zstandard
+    archive.zstandard = None
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            zst_kit = os.path.join(tmp_dir, 'hello.tar.zst')
+            with open(zst_kit, 'wb') as f:
+                f.write(b'not even compressed')
+
+            # there's no way to read it, and the user gets to know why
+            with assert_raises(KitException) as cm:
+                zenfig_kit.get_kit(zst_kit)
+            ok_('zstandard' in str(cm.exception))
+    finally:
+        archive.zstandard = zstandard
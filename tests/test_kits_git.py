@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test for: git kit provider
+"""
+
+import os
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from nose.tools import raises, eq_, ok_, assert_raises
+from helpers import setenv
+from zenfig import kit as zenfig_kit
+from zenfig.__main__ import main
+from zenfig.kits import KitException
+from zenfig.kits.git import GitRepoKit
+
+
+def _git(*args, cwd):
+    return subprocess.check_output(
+        ['git', '-c', 'user.name=zenfig', '-c', 'user.email=zenfig@localhost']
+        + list(args), cwd=cwd, universal_newlines=True
+    ).strip()
+
+
+def _commit_kit(repo_dir, message):
+    with open(os.path.join(repo_dir, 'templates', 'hello', 'main.j2'), 'w') as f:
+        f.write("{}\n".format(message))
+    _git('add', '-A', cwd=repo_dir)
+    _git('commit', '-q', '-m', message, cwd=repo_dir)
+    return _git('rev-parse', 'HEAD', cwd=repo_dir)
+
+
+def _create_kit_repo(tmp_dir):
+    """Create a bare repository holding a kit, with a bit of history"""
+
+    repo_dir = os.path.join(tmp_dir, 'src')
+    os.makedirs(os.path.join(repo_dir, 'templates', 'hello'))
+    os.makedirs(os.path.join(repo_dir, 'defaults'))
+    with open(os.path.join(repo_dir, 'defaults', 'vars.yml'), 'w') as f:
+        f.write("hello: world\n")
+    with open(os.path.join(repo_dir, 'index.yml'), 'w') as f:
+        f.write(
+            "author: me\nname: hello\nversion: '1.0'\n"
+            "templates:\n  hello:\n    output_file: hello.conf\n"
+        )
+    _git('init', '-q', '-b', 'master', cwd=repo_dir)
+    _commit_kit(repo_dir, 'first')
+    _git('tag', '-a', 'v1', '-m', 'v1', cwd=repo_dir)
+    _git('branch', 'other', cwd=repo_dir)
+    _commit_kit(repo_dir, 'second')
+
+    bare_dir = os.path.join(tmp_dir, 'kit.git')
+    _git('clone', '-q', '--bare', repo_dir, bare_dir, cwd=tmp_dir)
+    return repo_dir, 'file://{}'.format(bare_dir)
+
+
+def _read_template(kit):
+    with open(os.path.join(kit.root_dir, 'templates', 'hello', 'main.j2')) as f:
+        return f.read()
+
+
+class _KitCache:
+    """Point the kit cache somewhere else"""
+
+    def __init__(self, cache_home):
+        self._cache_home = cache_home
+
+    def __enter__(self):
+        self._old_cache_home = GitRepoKit.CACHE_HOME
+        GitRepoKit.CACHE_HOME = self._cache_home
+
+    def __exit__(self, *args):
+        GitRepoKit.CACHE_HOME = self._old_cache_home
+
+
+def test_git_kit_shallow_fetch():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repo_dir, repo_url = _create_kit_repo(tmp_dir)
+        with _KitCache(os.path.join(tmp_dir, 'kits')):
+            kit = GitRepoKit(repo_url)
+            eq_(_read_template(kit), "second\n")
+
+            # only the tip of the requested ref is there
+            repo_path = kit._git_repo_path
+            eq_(_git('rev-parse', '--is-shallow-repository', cwd=repo_path), 'true')
+            eq_(_git('rev-list', '--count', kit.commit, cwd=repo_path), '1')
+            refs = _git('for-each-ref', '--format=%(refname)', cwd=repo_path)
+            ok_('other' not in refs)
+            ok_('v1' not in refs)
+
+            # tags can be requested as well
+            kit = zenfig_kit.get_kit('{}==v1'.format(repo_url))
+            eq_(_read_template(kit), "first\n")
+
+            # refs that don't exist
+            assert_raises(KitException, GitRepoKit, repo_url, version='nope')
+
+
+def test_git_kit_freshness():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repo_dir, repo_url = _create_kit_repo(tmp_dir)
+        bare_dir = repo_url[len('file://'):]
+        with _KitCache(os.path.join(tmp_dir, 'kits')):
+            eq_(_read_template(GitRepoKit(repo_url)), "second\n")
+            eq_(_read_template(GitRepoKit(repo_url, version='v1')), "first\n")
+
+            # the remote repo moves on (tags included)
+            _commit_kit(repo_dir, 'third')
+            _git('tag', '-f', '-a', 'v1', '-m', 'v1', cwd=repo_dir)
+            _git('push', '-q', '--force', bare_dir, 'master', 'v1', cwd=repo_dir)
+
+            # branches are not checked until their time has come
+            eq_(_read_template(GitRepoKit(repo_url)), "second\n")
+
+            with setenv(ZF_KIT_TTL='0'):
+                eq_(_read_template(GitRepoKit(repo_url)), "third\n")
+
+                # tags never change
+                eq_(_read_template(GitRepoKit(repo_url, version='v1')), "first\n")
+
+                # whatever is on cache is used if the remote can't be reached
+                os.rename(bare_dir, bare_dir + '.moved')
+                eq_(_read_template(GitRepoKit(repo_url)), "third\n")
+
+
+def test_git_kit_concurrent():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repo_dir, repo_url = _create_kit_repo(tmp_dir)
+        with _KitCache(os.path.join(tmp_dir, 'kits')):
+            # all of them take turns on the very same kit cache
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                kits = list(executor.map(
+                    lambda version: GitRepoKit(repo_url, version=version),
+                    ['master', 'master', 'master', 'master']
+                ))
+            for kit in kits:
+                eq_(_read_template(kit), "second\n")
+
+
+def test_git_kit_prefetch():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repo_dir, repo_url = _create_kit_repo(tmp_dir)
+        with _KitCache(os.path.join(tmp_dir, 'kits')):
+            eq_(main(['prefetch', repo_url, '{}==v1'.format(repo_url)]), 0)
+            eq_(main(['prefetch', '{}==nope'.format(repo_url)]), 1)
+
+
+def test_git_kit_trees():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repo_dir, repo_url = _create_kit_repo(tmp_dir)
+        with _KitCache(os.path.join(tmp_dir, 'kits')):
+            kit_master = GitRepoKit(repo_url)
+            kit_v1 = GitRepoKit(repo_url, version='v1')
+
+            # each version has its own (read-only) tree,
+            # named after the commit it comes from
+            eq_(os.path.basename(kit_master.root_dir), kit_master.commit)
+            ok_(kit_master.root_dir != kit_v1.root_dir)
+            eq_(_read_template(kit_master), "second\n")
+            eq_(_read_template(kit_v1), "first\n")
+            ok_(not os.stat(kit_v1.root_dir).st_mode & 0o222)
+
+            # switching back and forth is a lookup
+            eq_(GitRepoKit(repo_url).root_dir, kit_master.root_dir)
+
+            # least recently used trees go away once over budget
+            keep_time = GitRepoKit.CACHE_TREES_KEEP_TIME
+            GitRepoKit.CACHE_TREES_KEEP_TIME = -1
+            try:
+                with setenv(ZF_KIT_STORE_SIZE='0'):
+                    os.utime(kit_master.root_dir, (0, 0))
+                    commit = _commit_kit(repo_dir, 'third')
+                    _git('push', '-q', repo_url, 'master', cwd=repo_dir)
+                    kit = GitRepoKit(repo_url, version=commit)
+                    eq_(_read_template(kit), "third\n")
+            finally:
+                GitRepoKit.CACHE_TREES_KEEP_TIME = keep_time
+            ok_(not os.path.exists(kit_master.root_dir))
+
+
+def test_git_kit_old_layout():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repo_dir, repo_url = _create_kit_repo(tmp_dir)
+        cache_home = os.path.join(tmp_dir, 'kits')
+
+        # clones (and their locks) from previous releases ...
+        old_clone = os.path.join(cache_home, 'me', 'kit')
+        _git('clone', '-q', repo_url, old_clone, cwd=tmp_dir)
+        with open('{}.lock'.format(old_clone), 'w'):
+            pass
+        with open(os.path.join(cache_home, 'a2l0.lock'), 'w'):
+            pass
+
+        # ... are wiped out as soon as a tree is checked out
+        with _KitCache(cache_home):
+            kit = GitRepoKit(repo_url)
+        eq_(_read_template(kit), "second\n")
+        eq_(
+            sorted(os.listdir(cache_home)),
+            [GitRepoKit.CACHE_REPOS, GitRepoKit.CACHE_TREES, 'trees.lock']
+        )
+
+
+def test_git_kit_tree_attributes():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repo_dir, repo_url = _create_kit_repo(tmp_dir)
+        with open(os.path.join(repo_dir, '.gitattributes'), 'w') as f:
+            f.write("templates/common.j2 export-ignore\n*.j2 export-subst\n")
+        with open(os.path.join(repo_dir, 'templates', 'common.j2'), 'w') as f:
+            f.write("common\n")
+        commit = _commit_kit(repo_dir, '$Format:%H$')
+        _git('push', '-q', repo_url, 'master', cwd=repo_dir)
+
+        # trees are exactly what their commits hold
+        with _KitCache(os.path.join(tmp_dir, 'kits')):
+            kit = GitRepoKit(repo_url, version=commit)
+            eq_(_read_template(kit), "$Format:%H$\n")
+            ok_(os.path.isfile(
+                os.path.join(kit.root_dir, 'templates', 'common.j2')
+            ))
+
+
+def test_git_kit_pin():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repo_dir, repo_url = _create_kit_repo(tmp_dir)
+        with _KitCache(os.path.join(tmp_dir, 'kits')):
+            kit = GitRepoKit(repo_url, version='v1')
+            pin = {'commit': kit.commit, 'tree': kit.tree}
+            eq_(kit.tree, _git('rev-parse', 'v1^{tree}', cwd=repo_dir))
+
+            # pinned trees are used as they are, no git involved
+            os.rename(kit._git_repo_path, kit._git_repo_path + '.moved')
+            kit = GitRepoKit(repo_url, pin=pin)
+            eq_(_read_template(kit), "first\n")
+            os.rename(kit._git_repo_path + '.moved', kit._git_repo_path)
+
+            # pinned commits are fetched if needed ...
+            commit = _git('rev-parse', 'master', cwd=repo_dir)
+            tree = _git('rev-parse', 'master^{tree}', cwd=repo_dir)
+            kit = GitRepoKit(repo_url, pin={'commit': commit, 'tree': tree})
+            eq_(_read_template(kit), "second\n")
+
+            # ... as long as they are what they were
+            commit = _commit_kit(repo_dir, 'third')
+            _git('push', '-q', repo_url, 'master', cwd=repo_dir)
+            assert_raises(KitException, GitRepoKit, repo_url,
+                          pin={'commit': commit, 'tree': tree})
+
+            # pinned commits must be full commit SHAs
+            assert_raises(KitException, GitRepoKit, repo_url,
+                          pin={'commit': '../../../etc', 'tree': tree})
+
+
+def test_git_kit_locked():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repo_dir, repo_url = _create_kit_repo(tmp_dir)
+        cache_home = os.path.join(tmp_dir, 'kits')
+        with _KitCache(cache_home):
+            # kits not pinned on the lockfile are never fetched
+            lockfile_path = os.path.join(tmp_dir, 'zenfig.lock')
+            eq_(main([
+                '-L', lockfile_path, '--locked', 'preview', repo_url
+            ]), 1)
+            ok_(not os.path.exists(cache_home))
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test for: kit lockfiles
+"""
+
+import os
+import tempfile
+from collections import namedtuple
+
+from nose.tools import raises, eq_, ok_, assert_raises
+from zenfig import lockfile
+
+FakeKit = namedtuple('FakeKit', ['name', 'commit', 'tree'])
+
+
+def test_lockfile_load_save():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'zenfig', 'zenfig.lock')
+
+        # no lockfile, no pins
+        eq_(lockfile.load(path), {})
+
+        entry = lockfile.get_entry(FakeKit('kit', 'c' * 40, 't' * 40))
+        eq_(entry, {'commit': 'c' * 40, 'tree': 't' * 40})
+        lockfile.save(path, {'user/kit': entry})
+        eq_(lockfile.load(path), {'user/kit': entry})
+
+        # entries already there are kept
+        lockfile.save(path, {'user/other==v1': entry})
+        eq_(sorted(lockfile.load(path)), ['user/kit', 'user/other==v1'])
+
+        # local kits can't be pinned
+        eq_(lockfile.get_entry(FakeKit('kit', None, None)), None)
+
+
+@raises(lockfile.LockfileException)
+def test_lockfile_invalid():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'zenfig.lock')
+        with open(path, 'w') as f:
+            f.write("kits:\n  user/kit: {commit: abc}\n")
+        lockfile.load(path)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test for: log
+"""
+
+import os
+import tempfile
+
+from nose.tools import raises, eq_, ok_, assert_raises
+from zenfig import log
+from zenfig import util
+
+
+class _Unformattable:
+    def __format__(self, format_spec):
+        raise AssertionError("formatted while not being issued")
+
+
+def _read_log(level, log_func):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_file = os.path.join(tmp_dir, 'zenfig.log')
+        log.init(level=level, log_file=log_file)
+        try:
+            log_func()
+        finally:
+            log.init()
+        with open(log_file) as f:
+            return f.read()
+
+
+def test_log_levels():
+    def _log_all():
+        log.msg("info {}", 1)
+        log.msg_debug("debug {}", 2)
+        log.msg_warn("warn {}", 3)
+
+    eq_(_read_log(log.LOG_LEVEL_WARN, _log_all), " (!) warn 3\n")
+    eq_(
+        _read_log(log.LOG_LEVEL_INFO, _log_all),
+        " --- info 1\n (!) warn 3\n"
+    )
+    eq_(
+        _read_log(log.LOG_LEVEL_DEBUG, _log_all),
+        " --- info 1\n (*) debug 2\n (!) warn 3\n"
+    )
+
+
+def test_log_lazy_format():
+    def _log_unformattable():
+        log.msg("info {}", _Unformattable())
+        log.msg_debug("debug {}", _Unformattable())
+        log.msg_debug("{not a format string}")
+
+    eq_(_read_log(log.LOG_LEVEL_WARN, _log_unformattable), "")
+    assert_raises(
+        AssertionError, _read_log, log.LOG_LEVEL_INFO, _log_unformattable
+    )
+
+
+def test_autolog():
+    # functions get decorated before the log is initiated ...
+    @util.autolog
+    def func(a, b):
+        return a + b
+
+    def _call():
+        eq_(func(1, 2), 3)
+
+    # ... and yet, their calls are logged when debugging
+    eq_(_read_log(log.LOG_LEVEL_INFO, _call), "")
+    ok_(_read_log(log.LOG_LEVEL_DEBUG, _call).startswith(" (*) func (t = "))
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test for: kit manifests
+"""
+
+import os
+import tempfile
+from collections import namedtuple
+
+from nose.tools import raises, eq_, ok_, assert_raises
+from helpers import setenv
+from zenfig import renderer
+from zenfig.manifest import Manifest
+
+# Manifests only care about kit names
+FakeKit = namedtuple('FakeKit', ['name'])
+
+
+def test_manifest_is_outdated():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with setenv(XDG_CACHE_HOME=tmp_dir):
+            template_dir = os.path.join(tmp_dir, 'templates', 'hello')
+            os.makedirs(template_dir)
+            with open(os.path.join(template_dir, 'main.j2'), 'w') as f:
+                f.write("{{ hello }}\n{% include 'inc.j2' %}\n")
+            with open(os.path.join(template_dir, 'inc.j2'), 'w') as f:
+                f.write("{{ world }}\n")
+            template_data = {
+                'path': 'hello/main.j2',
+                'include': [template_dir, os.path.join(tmp_dir, 'templates')],
+                'output_file': os.path.join(tmp_dir, 'out'),
+            }
+            vars = {'hello': 'hi', 'world': 'there', 'unused': 1}
+
+            # Nothing has been rendered yet
+            manifest = Manifest(FakeKit('kit'))
+            ok_(manifest.is_outdated(template_data, vars))
+            renderer.render_files(
+                vars=vars, templates=[template_data], manifest=manifest
+            )
+            manifest.save()
+
+            # Nothing has changed
+            manifest = Manifest(FakeKit('kit'))
+            ok_(not manifest.is_outdated(template_data, vars))
+
+            # Variables not used by the template don't count
+            vars['unused'] = 2
+            ok_(not manifest.is_outdated(template_data, vars))
+
+            # ... but those used by its includes do
+            vars['world'] = 'world'
+            ok_(manifest.is_outdated(template_data, vars))
+            vars['world'] = 'there'
+
+            # Included templates count as well
+            with open(os.path.join(template_dir, 'inc.j2'), 'w') as f:
+                f.write("{{ world }}!\n")
+            ok_(manifest.is_outdated(template_data, vars))
@@ -4,7 +4,12 @@
 Test for: template renderer
 """
 
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
 from nose.tools import raises, eq_, ok_, assert_raises
+from helpers import setenv
 from zenfig import renderer
 from zenfig.depgraph import DepGraphException
 
@@ -108,3 +113,268 @@ def test_renderer_render_dict():
         "hello": "{{ @hello }}",
     }
     assert_raises(DepGraphException, renderer.render_dict, **var_circ_dep)
+
+
+def test_renderer_var_refs():
+    # multiple blocks, no duplicates
+    eq_(renderer._get_var_refs("{{ @a }}-{{ @b|upper }}-{{ @a }}"), ('a', 'b'))
+
+    # references within statements count as well
+    eq_(renderer._get_var_refs("{% if @flag %}{{ @on }}{% endif %}"),
+        ('flag', 'on'))
+
+    # ... while those in plain text or quoted strings do not
+    eq_(renderer._get_var_refs("mail@home {{ '@quoted' ~ @real }}"), ('real',))
+    eq_(renderer._get_var_refs("@nothing"), ())
+
+    # names sharing a prefix are told apart
+    eq_(renderer._get_var_refs("{{ @color_base0 ~ @color_base0A }}"),
+        ('color_base0', 'color_base0A'))
+
+
+def test_renderer_render_vars_refs():
+    # names sharing a prefix are told apart
+    r = renderer.render_dict(**{
+        "color": "{{ @color_base0 }}/{{ @color_base0A }}",
+        "color_base0": "000000",
+        "color_base0A": "0a0a0a",
+    })
+    eq_(r['color'], "000000/0a0a0a")
+
+    # values are passed as they are, no quoting involved
+    r = renderer.render_dict(**{
+        "message": "{{ @quote }} {{ @nothing is none }}",
+        "quote": 'say "hi"',
+        "nothing": None,
+        "mail": "me@home {{ @quote|length }}",
+    })
+    eq_(r['message'], 'say "hi" True')
+    eq_(r['mail'], "me@home 8")
+
+    # large collections holding lots of references
+    var_dict = {"v{}".format(i): str(i) for i in range(200)}
+    var_dict['all'] = ["{{{{ @v{} }}}}".format(i) for i in range(200)]
+    r = renderer.render_dict(**var_dict)
+    eq_(r['all'], [str(i) for i in range(200)])
+
+
+def test_renderer_render_vars_native():
+    r = renderer.render_dict(**{
+        "font_size": 10,
+        "font_size_big": "{{ @font_size * 2 }}",
+        "font": "{{ @font_name }} {{ @font_size_big }}",
+        "font_name": "Hack",
+        "colors": "{{ @palette }}",
+        "palette": ["#000000", "#ffffff"],
+        "enabled": "{{- @font_size > 5 -}}",
+        "color_hex": "{{ @color_base }}",
+        "color_base": "181818",
+    })
+
+    # single expressions keep their types
+    eq_(r['font_size_big'], 20)
+    eq_(r['colors'], ["#000000", "#ffffff"])
+    eq_(r['enabled'], True)
+
+    # strings are never converted into anything else
+    eq_(r['color_hex'], "181818")
+
+    # ... and so are values made of anything else
+    eq_(r['font'], "Hack 20")
+
+
+def test_renderer_render_vars_native_undefined():
+    r = renderer.render_dict(**{
+        "a": "x",
+        "off": False,
+        "colors": {"fg": "#ffffff"},
+        "opt": "{{ @a if @off }}",
+        "missing_key": "{{ @colors.bg }}",
+        "missing_item": "{{ @colors['bg'] }}",
+    })
+
+    # undefined results are rendered as empty strings, just like in templates
+    eq_(r['opt'], '')
+    eq_(r['missing_key'], '')
+    eq_(r['missing_item'], '')
+
+
+def test_renderer_render_vars_comments():
+    r = renderer.render_dict(**{
+        "a": "x",
+        "size": 10,
+        "ref_comment": "{{ @a }}{# c #}",
+        "comment_ref": "{# c #}{{ @a }}",
+        "native_comment": "{{ @size }}{# c #}",
+        "plain_comment": "{{ a }}{# c #}",
+    })
+
+    # comments around an expression make it a template
+    eq_(r['ref_comment'], 'x')
+    eq_(r['comment_ref'], 'x')
+    eq_(r['native_comment'], '10')
+
+    # ... while those without references are left alone
+    eq_(r['plain_comment'], '{{ a }}{# c #}')
+
+
+def test_renderer_render_vars_executor():
+    var_dict = {
+        "color_fg": "{{ @color_base|norm_hex }}",
+        "color_base": "#{{ @color_hex }}",
+        "color_hex": "181818",
+        "message": "{{ @greeting }}, {{ @color_fg }}",
+        "greeting": "Hello",
+    }
+    expected = renderer.render_vars(var_dict)
+    for executor_class in [ThreadPoolExecutor, ProcessPoolExecutor]:
+        with executor_class(max_workers=2) as executor:
+            eq_(renderer.render_vars(var_dict, executor=executor), expected)
+
+
+def test_renderer_template_cache():
+    # repeated expressions are compiled only once
+    var_dict_repeated = {
+        "base": "1a1a1a",
+        "color_a": "{{ @base }}",
+        "color_b": "{{ @base }}",
+        "color_c": "{{ @base }}",
+    }
+    graph = renderer.VarDepGraph(**var_dict_repeated)
+    r = graph.evaluate()
+    eq_("1a1a1a", r['color_a'])
+    eq_("1a1a1a", r['color_c'])
+    eq_(1, graph.tpl_cache.misses)
+    eq_(2, graph.tpl_cache.hits)
+
+    # least recently used templates are discarded
+    tpl_cache = renderer.TemplateCache(renderer._create_var_env(), maxsize=2)
+    tpl_cache.get_template("{{ 1 }}")
+    tpl_cache.get_template("{{ 2 }}")
+    tpl_cache.get_template("{{ 1 }}")
+    tpl_cache.get_template("{{ 3 }}")
+    tpl_cache.get_template("{{ 1 }}")
+    eq_(2, tpl_cache.hits)
+    tpl_cache.get_template("{{ 2 }}")
+    eq_(4, tpl_cache.misses)
+
+
+def test_renderer_bytecode_cache_key():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bcc = renderer.TemplateBytecodeCache(tmp_dir)
+        tpl_file = os.path.join(tmp_dir, 'main.j2')
+        with open(tpl_file, 'w') as f:
+            f.write("{{ hello }}")
+
+        # keys are stable as long as the template file stays the same
+        os.utime(tpl_file, (1000, 1000))
+        key = bcc.get_cache_key('main.j2', tpl_file)
+        eq_(key, bcc.get_cache_key('main.j2', tpl_file))
+
+        # ... and they change along with its modification time
+        os.utime(tpl_file, (2000, 2000))
+        ok_(key != bcc.get_cache_key('main.j2', tpl_file))
+
+
+def _create_templates(tmp_dir, count):
+    """Create a bunch of templates the way kits have them"""
+
+    templates = []
+    for i in range(count):
+        template_dir = os.path.join(tmp_dir, 'templates', str(i))
+        os.makedirs(template_dir)
+        with open(os.path.join(template_dir, 'main.j2'), 'w') as f:
+            f.write("{{ hello }} from {{ %d }}\n" % i)
+        templates.append({
+            'path': '{}/main.j2'.format(i),
+            'include': [template_dir, os.path.join(tmp_dir, 'templates')],
+            'output_file': os.path.join(tmp_dir, 'out_{}'.format(i)),
+        })
+    return templates
+
+
+def test_renderer_render_files():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with setenv(XDG_CACHE_HOME=tmp_dir):
+            templates = _create_templates(tmp_dir, 4)
+
+            # templates are rendered the same way, no matter how many jobs
+            for jobs in (1, 3):
+                renderer.render_files(
+                    vars={'hello': 'hi {}'.format(jobs)},
+                    templates=templates, jobs=jobs
+                )
+                for i, template_data in enumerate(templates):
+                    with open(template_data['output_file']) as f:
+                        eq_(f.read(), "hi {} from {}\n".format(jobs, i))
+
+
+def test_renderer_write_output():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_file = os.path.join(tmp_dir, 'out.conf')
+        with open(output_file, 'w') as f:
+            f.write("old\n")
+        os.chmod(output_file, 0o640)
+
+        # file mode is kept
+        renderer._write_output(iter(["new", "\n"]), output_file)
+        with open(output_file) as f:
+            eq_(f.read(), "new\n")
+        eq_(os.stat(output_file).st_mode & 0o777, 0o640)
+
+        # files with the same contents are not written again
+        inode = os.stat(output_file).st_ino
+        renderer._write_output("new\n", output_file)
+        eq_(os.stat(output_file).st_ino, inode)
+
+        # symlinks are followed
+        link_file = os.path.join(tmp_dir, 'link.conf')
+        os.symlink(output_file, link_file)
+        renderer._write_output("linked\n", link_file)
+        ok_(os.path.islink(link_file))
+        with open(output_file) as f:
+            eq_(f.read(), "linked\n")
+
+        # failed renders leave output files untouched
+        def _failed_render():
+            yield "half"
+            raise RuntimeError("failed render")
+        assert_raises(RuntimeError, renderer._write_output,
+                      _failed_render(), output_file)
+        with open(output_file) as f:
+            eq_(f.read(), "linked\n")
+        eq_(sorted(os.listdir(tmp_dir)), ['link.conf', 'out.conf'])
+
+
+def test_renderer_write_output_owner():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_file = os.path.join(tmp_dir, 'out.conf')
+        with open(output_file, 'w') as f:
+            f.write("old\n")
+
+        # files owned by someone else keep their owner
+        # (only root gets to give files away, though)
+        owner = (1, 1) if os.getuid() == 0 else (os.getuid(), os.getgid())
+        os.chown(output_file, *owner)
+        renderer._write_output("new\n", output_file)
+        file_stat = os.stat(output_file)
+        eq_((file_stat.st_uid, file_stat.st_gid), owner)
+
+
+def test_renderer_write_output_newlines():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_file = os.path.join(tmp_dir, 'out.conf')
+        with open(output_file, 'wb') as f:
+            f.write(b"a\r\nb\r\n")
+
+        # line endings are part of the contents ...
+        renderer._write_output("a\nb\n", output_file)
+        with open(output_file, 'rb') as f:
+            eq_(f.read(), b"a\nb\n")
+
+        # ... so identical CRLF contents are not written again
+        renderer._write_output("a\r\nb\r\n", output_file)
+        inode = os.stat(output_file).st_ino
+        output_hash = renderer._write_output("a\r\nb\r\n", output_file)
+        eq_(os.stat(output_file).st_ino, inode)
+        eq_(renderer.get_output_hash(output_file), output_hash)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test for: CLI startup time
+"""
+
+import os
+import sys
+import subprocess
+
+from nose.tools import raises, eq_, ok_, assert_raises
+
+# Time budget (in microseconds) for importing the CLI entry point
+STARTUP_BUDGET = 150000
+
+# Modules zenfig must not import unless it actually needs them
+HEAVY_MODULES = [
+    'jinja2', 'yaml', 'git', 'voluptuous',
+    'psutil', 'cpuinfo', 'webcolors',
+]
+
+PKG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _python(*args):
+    return subprocess.run(
+        [sys.executable] + list(args), cwd=PKG_DIR,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+
+
+def _get_import_time(module_name):
+    """Get the cumulative import time of a module, as -X importtime says"""
+
+    proc = _python('-X', 'importtime', '-c', 'import {}'.format(module_name))
+    eq_(proc.returncode, 0)
+    for line in proc.stderr.splitlines():
+        fields = [field.strip() for field in line.split('|')]
+        if len(fields) == 3 and fields[2] == module_name:
+            return int(fields[1])
+    raise AssertionError("'{}' has not been imported".format(module_name))
+
+
+def test_startup_budget():
+    # First run is only meant to get all bytecode compiled
+    _get_import_time('zenfig.__main__')
+    import_time = min(_get_import_time('zenfig.__main__') for _ in range(3))
+    ok_(
+        import_time < STARTUP_BUDGET,
+        "zenfig.__main__ took {} us to import (budget: {} us)"
+        .format(import_time, STARTUP_BUDGET)
+    )
+
+
+def test_startup_lazy_imports():
+    proc = _python('-c', (
+        "import sys\n"
+        "from zenfig.__main__ import main\n"
+        "try:\n"
+        "    main(['--version'])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(' '.join(sorted(sys.modules)))\n"
+    ))
+    eq_(proc.returncode, 0)
+    modules = set(proc.stdout.split())
+    for module_name in HEAVY_MODULES:
+        ok_(module_name not in modules, "'{}' has been imported".format(module_name))
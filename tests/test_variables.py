@@ -4,10 +4,16 @@
 Test for: variables module
 """
 
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
 from nose.tools import raises, eq_, ok_, assert_raises
+from helpers import setenv
 from zenfig.api import color
 
 from zenfig import variables
+from zenfig.kit import get_kit
 
 def test_get_vars_from_env():
     correct_paths = [
@@ -26,3 +32,248 @@ def test_get_vars_from_env():
         eq_(variables._get_vars_from_env(path), result)
     for path in incorrect_paths:
         eq_(variables._get_vars_from_env(path), None)
+
+
+def test_get_facts_cache():
+    calls = []
+
+    def _get_facts_static():
+        calls.append('static')
+        return {'zenfig_static': 1}
+
+    def _get_facts_volatile():
+        calls.append('volatile')
+        return {'zenfig_volatile': 2}
+
+    fact_providers = variables.FACT_PROVIDERS
+    variables.FACT_PROVIDERS = [
+        ('static', _get_facts_static, variables.FACTS_TTL_DAY, ['static']),
+        ('volatile', _get_facts_volatile, variables.FACTS_TTL_NONE, ['volatile']),
+    ]
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+        setenv(XDG_CACHE_HOME=tmp_dir):
+            facts = variables._get_facts()
+            eq_(facts, {'zenfig_static': 1, 'zenfig_volatile': 2})
+            eq_(calls, ['static', 'volatile'])
+
+            # static facts are taken from cache from now on
+            eq_(variables._get_facts(), facts)
+            eq_(calls, ['static', 'volatile', 'volatile'])
+
+            # unless they are explicitly refreshed
+            eq_(variables._get_facts(refresh=True), facts)
+            eq_(calls, ['static', 'volatile', 'volatile', 'static', 'volatile'])
+
+            # only referenced facts are gathered
+            del calls[:]
+            eq_(variables._get_facts(names={'zenfig_volatile'}), {'zenfig_volatile': 2})
+            eq_(calls, ['volatile'])
+    finally:
+        variables.FACT_PROVIDERS = fact_providers
+
+
+def test_scan_fact_refs():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        var_file = os.path.join(tmp_dir, 'vars.yml')
+        with open(var_file, 'w') as f:
+            f.write("cpu: '{{ @zenfig_cpu_brand }}'\nhello: world\n")
+        with setenv(HOME=tmp_dir):
+            eq_(variables._scan_fact_refs(var_files=[tmp_dir]), {'zenfig_cpu_brand'})
+
+
+def test_scan_fact_refs_kit_index():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        kit_dir = os.path.join(tmp_dir, 'kit')
+        os.makedirs(os.path.join(kit_dir, 'templates', 'hello'))
+        os.makedirs(os.path.join(kit_dir, 'defaults'))
+        with open(os.path.join(kit_dir, 'index.yml'), 'w') as f:
+            f.write(
+                "author: me\nname: hello\nversion: '1.0'\n"
+                "templates:\n  hello:\n    output_file: hello.conf\n"
+                "    comment: 'for {{ @zenfig_user }}'\n"
+            )
+        with open(os.path.join(kit_dir, 'templates', 'hello', 'main.j2'), 'w') as f:
+            f.write("hello\n")
+
+        # facts referenced only by the kit index are found as well
+        with setenv(HOME=tmp_dir):
+            eq_(
+                variables._scan_fact_refs(var_files=[], kit=get_kit(kit_dir)),
+                {'zenfig_user'}
+            )
+
+
+def test_get_kits_vars():
+    calls = []
+    get_facts = variables._get_facts
+    read_var_file = variables._read_var_file
+
+    def _get_facts(**kwargs):
+        calls.append('facts')
+        return get_facts(**kwargs)
+
+    def _read_var_file(var_file):
+        calls.append(var_file)
+        return read_var_file(var_file)
+
+    variables._get_facts = _get_facts
+    variables._read_var_file = _read_var_file
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir, setenv(HOME=tmp_dir):
+            var_file = os.path.join(tmp_dir, 'vars.yml')
+            with open(var_file, 'w') as f:
+                f.write("hello: world\nmessage: {hi: '{{ @hello }}'}\n")
+            kits_vars = variables.get_kits_vars(
+                kits=[None, None], user_var_files=[var_file],
+                use_cache=False, lazy_facts=True
+            )
+    finally:
+        variables._get_facts = get_facts
+        variables._read_var_file = read_var_file
+
+    # facts and shared variable files are gathered once for all kits ...
+    eq_(calls.count('facts'), 1)
+    eq_(calls.count(var_file), 1)
+
+    # ... yet each kit gets its own copy of shared variables
+    eq_(len(kits_vars), 2)
+    for user_vars in kits_vars:
+        eq_(user_vars['message'], {'hi': 'world'})
+    ok_(kits_vars[0]['message'] is not kits_vars[1]['message'])
+
+
+def test_get_kits_vars_cache():
+    calls = []
+    render_vars = variables.renderer.render_vars
+
+    def _render_vars(vars, **kwargs):
+        calls.append(vars)
+        return render_vars(vars, **kwargs)
+
+    def _get_kits_vars(var_file):
+        return variables.get_kits_vars(
+            kits=[None], user_var_files=[var_file], lazy_facts=True
+        )[0]
+
+    variables.renderer.render_vars = _render_vars
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+        setenv(HOME=tmp_dir, XDG_CACHE_HOME=tmp_dir):
+            var_file = os.path.join(tmp_dir, 'vars.yml')
+            with open(var_file, 'w') as f:
+                f.write("hello: world\nmessage: '{{ @hello }}!'\n")
+            eq_(_get_kits_vars(var_file)['message'], 'world!')
+            eq_(len(calls), 1)
+
+            # variables are taken from cache as long as nothing changes ...
+            eq_(_get_kits_vars(var_file)['message'], 'world!')
+            eq_(len(calls), 1)
+
+            # ... otherwise, they are resolved all over again
+            with open(var_file, 'w') as f:
+                f.write("hello: there\nmessage: '{{ @hello }}!'\n")
+            eq_(_get_kits_vars(var_file)['message'], 'there!')
+            eq_(len(calls), 2)
+    finally:
+        variables.renderer.render_vars = render_vars
+
+
+def test_get_kits_vars_jobs():
+    pools = []
+    process_pool_executor = variables.ProcessPoolExecutor
+
+    class _ProcessPoolExecutor(ThreadPoolExecutor):
+        def __init__(self, max_workers):
+            pools.append(max_workers)
+            super().__init__(max_workers=max_workers)
+
+    def _get_kits_vars(var_file, jobs):
+        return variables.get_kits_vars(
+            kits=[None, None], user_var_files=[var_file],
+            lazy_facts=True, jobs=jobs
+        )
+
+    variables.ProcessPoolExecutor = _ProcessPoolExecutor
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+        setenv(HOME=tmp_dir, XDG_CACHE_HOME=tmp_dir):
+            var_file = os.path.join(tmp_dir, 'vars.yml')
+            with open(var_file, 'w') as f:
+                f.write("hello: world\nmessage: '{{ @hello }}!'\n")
+
+            # no pool for a single process ...
+            kits_vars = _get_kits_vars(var_file, 1)
+            eq_(pools, [])
+
+            # ... nor for variables taken from cache
+            eq_(_get_kits_vars(var_file, 4), kits_vars)
+            eq_(pools, [])
+
+            # otherwise, a single pool is shared by all kits
+            with open(var_file, 'a') as f:
+                f.write("extra: yes\n")
+            kits_vars = _get_kits_vars(var_file, 4)
+            eq_(pools, [4])
+            eq_([v['message'] for v in kits_vars], ['world!', 'world!'])
+    finally:
+        variables.ProcessPoolExecutor = process_pool_executor
+
+
+def test_load_var_file():
+    calls = []
+    yaml_load = variables.util.yaml_load
+
+    def _yaml_load(stream):
+        calls.append(stream)
+        return yaml_load(stream)
+
+    variables.util.yaml_load = _yaml_load
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+        setenv(XDG_CACHE_HOME=tmp_dir):
+            var_file = os.path.join(tmp_dir, 'vars.yml')
+            with open(var_file, 'w') as f:
+                f.write("font_size: 10\n")
+            eq_(variables._load_var_file(var_file), {'font_size': 10})
+            eq_(len(calls), 1)
+
+            # unchanged files are not parsed again
+            eq_(variables._load_var_file(var_file), {'font_size': 10})
+            eq_(len(calls), 1)
+
+            # ... while changed ones are
+            with open(var_file, 'w') as f:
+                f.write("font_size: 120\n")
+            eq_(variables._load_var_file(var_file), {'font_size': 120})
+            eq_(len(calls), 2)
+    finally:
+        variables.util.yaml_load = yaml_load
+
+
+def test_get_vars_precedence():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with setenv(XDG_CACHE_HOME=tmp_dir):
+            var_dir = os.path.join(tmp_dir, 'vars')
+            os.mkdir(var_dir)
+            for i in range(20):
+                with open(os.path.join(var_dir, '{:02}.yml'.format(i)), 'w') as f:
+                    f.write("last: {}\nvar{}: {}\n".format(i, i, i))
+            with open(os.path.join(var_dir, 'README.md'), 'w') as f:
+                f.write("last: readme\n")
+            var_file = os.path.join(tmp_dir, 'user.yaml')
+            with open(var_file, 'w') as f:
+                f.write("var3: user\n")
+
+            tpl_vars, tpl_files = variables._get_vars(var_files=[
+                var_dir, var_file, os.path.join(tmp_dir, 'missing.yml')
+            ])
+
+            # files inside directories are merged in order ...
+            eq_(tpl_vars['last'], 19)
+            eq_(tpl_files['last'], os.path.join(var_dir, '19.yml'))
+
+            # ... and later search path entries take precedence
+            eq_(tpl_vars['var3'], 'user')
+            eq_(tpl_files['var3'], var_file)
+            eq_(len(tpl_vars), 21)
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test for: file system watcher
+"""
+
+import os
+import tempfile
+
+from nose.tools import raises, eq_, ok_, assert_raises
+from zenfig import watch
+
+
+def test_watch_snapshot_changes():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        var_file = os.path.join(tmp_dir, 'vars', 'hello.yml')
+        missing_file = os.path.join(tmp_dir, 'missing.yml')
+        os.makedirs(os.path.dirname(var_file))
+        with open(var_file, 'w') as f:
+            f.write("hello: world")
+
+        snapshot = watch._snapshot([tmp_dir, missing_file])
+        eq_(list(snapshot.keys()), [var_file])
+        eq_(watch._get_changes(snapshot, watch._snapshot([tmp_dir, missing_file])), set())
+
+        # files are modified
+        with open(var_file, 'w') as f:
+            f.write("hello: there!")
+        new_snapshot = watch._snapshot([tmp_dir, missing_file])
+        eq_(watch._get_changes(snapshot, new_snapshot), {var_file})
+
+        # ... or they come into existence
+        with open(missing_file, 'w') as f:
+            f.write("hello: world")
+        eq_(
+            watch._get_changes(new_snapshot, watch._snapshot([tmp_dir, missing_file])),
+            {missing_file}
+        )
@@ -18,4 +18,22 @@ __version__ = '0.6.0'
 __licence__ = 'MIT'
 __copyright__ = 'Copyright (c) Alejandro Ricoveri'
 
-from .variables import get_user_vars
+# Both of these are brought in on first access (PEP 562):
+# zenfig.variables (and all of its dependencies) takes a while
+# to load, and not every command actually needs it
+_LAZY_ATTRS = {
+    'get_user_vars': 'variables',
+    'get_kits_vars': 'variables',
+}
+
+
+def __getattr__(name):
+    try:
+        module_name = _LAZY_ATTRS[name]
+    except KeyError:
+        raise AttributeError(
+            "module '{}' has no attribute '{}'".format(__name__, name)
+        ) from None
+
+    from importlib import import_module
+    return getattr(import_module('.' + module_name, __name__), name)
@@ -14,25 +14,45 @@ Main module
 import sys
 import os
 import time
-import traceback
 
 from docopt import docopt
 from docopt import DocoptExit
 
-from zenfig import renderer
 from zenfig import log
-from zenfig import variables
 from zenfig import PKG_URL as pkg_url
 from zenfig import __name__ as pkg_name, __version__ as pkg_version
-from zenfig import kit
+from zenfig import cache
+from zenfig import util
+from zenfig.kits import KitException
+
+#################################################################
+# Modules bringing in heavy dependencies (jinja2, yaml, GitPython,
+# psutil, etc.) are imported by the commands actually using them,
+# so things like 'zenfig --version' or 'zenfig cache' start fast
+#################################################################
+
+# Maximum number of kits fetched at once by prefetch
+PREFETCH_MAX_WORKERS = 8
 
 
 def _parse_args(argv):
-    """Usage: zenfig [-x] [-v]... [-I <varfile>]... (install|preview) <kit>
+    """Usage:
+    zenfig [-x] [-f] [-v]... [--log-file <logfile>] [--refresh-facts] [-j <jobs>] [--var-jobs <jobs>] [-K <kitfile>] [-L <lockfile>] [--locked] [-I <varfile>]... (install|preview|watch) [<kit>...]
+    zenfig [-v]... [--log-file <logfile>] [-K <kitfile>] prefetch [<kit>...]
+    zenfig [-v]... [--log-file <logfile>] cache (info|purge)
 
+Options:
     -I <varfile>, --include <varfile>  Variables file/directory to include
-    -v  Output verbosity
+    -v  Output verbosity (-v: messages, -vv: debug messages as well)
+    --log-file <logfile>               Append all messages to a file instead of stderr
     -x, --defaults-only                Discard any variable locations set by the user
+    --refresh-facts                    Gather all facts again, even cached ones
+    -j <jobs>, --jobs <jobs>           Number of templates to be rendered at once [default: 1]
+    --var-jobs <jobs>                  Number of processes variables are resolved on [default: 1]
+    -f, --force                        Render all templates, even those which are up to date
+    -K <kitfile>, --kits <kitfile>     YAML file holding a list of kits to be used
+    -L <lockfile>, --lockfile <lockfile>  Lockfile pinning kits to commits (default: ~/.zenfig/zenfig.lock)
+    --locked                           Use kits exactly as pinned on the lockfile
     """
 
     return docopt(_parse_args.__doc__, argv=argv, version=pkg_version)
@@ -58,17 +78,44 @@ def _start(*, options):
 
     # Log initalization should take place
     # before anything else
-    quiet_stdout = not bool(options['-v'])
-    log.init(quiet_stdout=quiet_stdout)
+    log.init(
+        level=min(options['-v'], log.LOG_LEVEL_DEBUG),
+        log_file=options['--log-file']
+    )
 
     # Show splash
     _splash()
 
+    # Cache management has nothing to do with kits
+    if options['cache']:
+        _cache(options=options)
+        return
+
     # measure execution time properly
     start_time = time.time()
 
-    # Variable locations taken from args
-    user_var_files = options['--include']
+    # Warm up kit caches, nothing else
+    if options['prefetch']:
+        _prefetch(kit_names=_get_kit_names(options=options))
+        log.msg("Done! ({:.3f} ms)", (time.time() - start_time)*1000)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+    from zenfig import kit
+    from zenfig import manifest
+    from zenfig import lockfile
+
+    # Number of templates to be rendered at once
+    try:
+        jobs = int(options['--jobs'])
+    except ValueError:
+        raise DocoptExit("--jobs must be a number") from None
+
+    # ... and number of processes variables are resolved on
+    try:
+        var_jobs = int(options['--var-jobs'])
+    except ValueError:
+        raise DocoptExit("--var-jobs must be a number") from None
 
     ###################################
     # Initialize kit interface:
@@ -77,53 +124,249 @@ def _start(*, options):
     # the appropiate interface based on
     # kit_name.
     ###################################
-    kit_name = options['<kit>']
+    kit_names = _get_kit_names(options=options)
+
+    # Kits can be pinned to commits
+    lockfile_path = options['--lockfile']
+    if lockfile_path is None:
+        lockfile_path = lockfile.get_default_path()
+    kit_pins = {}
+    if options['--locked']:
+        kit_pins = lockfile.load(lockfile_path)
+
+        # Kits not pinned on the lockfile can't be used as locked,
+        # this is known before any of them gets fetched
+        for kit_name in kit_names:
+            provider, _, _ = kit.get_provider(kit_name)
+            if provider.PINNABLE and kit_name not in kit_pins:
+                raise lockfile.LockfileException(
+                    "'{}' is not pinned on lockfile '{}'"
+                    .format(kit_name, lockfile_path)
+                )
+
+    # Initialise kit interfaces: kits are independent
+    # from each other, so they are all loaded at once
+    with ThreadPoolExecutor(max_workers=len(kit_names)) as executor:
+        kits = list(executor.map(
+            lambda kit_name: kit.get_kit(kit_name, pin=kit_pins.get(kit_name)),
+            kit_names
+        ))
+
+    # Only templates whose inputs have changed get to be rendered
+    kit_manifests = [None] * len(kits)
+    if not options['--force']:
+        kit_manifests = [manifest.Manifest(_kit) for _kit in kits]
+
+    _install(
+        options=options, kits=kits, jobs=jobs, var_jobs=var_jobs,
+        kit_manifests=kit_manifests
+    )
 
-    # Initialise kit interface
-    _kit = kit.get_kit(kit_name)
+    # Record what kits have been resolved to
+    if not options['preview'] and not options['--locked']:
+        _lock(lockfile_path=lockfile_path, kit_names=kit_names, kits=kits)
+
+    # Measure execution time
+    log.msg("Done! ({:.3f} ms)", (time.time() - start_time)*1000)
+
+    ################################################
+    # Watch mode: this process stays resident, kits are
+    # rendered again every time either their variables
+    # or templates change.
+    ################################################
+    if options['watch']:
+        _watch(
+            options=options, kits=kits, jobs=jobs, var_jobs=var_jobs,
+            kit_manifests=kit_manifests
+        )
 
-    ####################
-    # Get user variables
-    ####################
-    user_vars = variables.get_user_vars(
-        user_var_files=user_var_files,
-        kit=_kit,
-        defaults_only=options['--defaults-only'],
-    )
 
-    for template_data in _kit.templates.values():
+def _get_kit_names(*, options):
+    """
+    Get the names of all kits to be used
 
-        # Obtain basic information from the kit
-        template_file = template_data['path']
-        template_include_dirs = template_data['include']
+    Kits can be given at the command line and/or in
+    a kits file, which is a YAML file holding a list of kits.
 
-        # Depending on command set, the file would be either
-        # displayed on screen or written onto a file
-        if not options['preview']:
-            output_file = template_data['output_file']
-        else:
-            log.msg_warn('Previewing file: {}'.format(
-                template_data['output_file']
-            ))
-            log.msg_warn('---')
-            output_file = None
+    :param options: list of arguments
+    :returns: a list of kit names
+    """
+
+    kit_names = list(options['<kit>'])
+    if options['--kits'] is not None:
+        import yaml
+        with open(options['--kits'], 'r') as kits_file:
+            kits_file_names = yaml.safe_load(kits_file)
+        if not isinstance(kits_file_names, list):
+            raise DocoptExit(
+                "'{}' must hold a list of kits".format(options['--kits'])
+            )
+        kit_names.extend(str(kit_name) for kit_name in kits_file_names)
+
+    if not kit_names:
+        raise DocoptExit("At least one kit must be specified")
+
+    # Make sure there are no duplicates in this one
+    return sorted(set(kit_names), key=lambda x: kit_names.index(x))
+
+
+def _lock(*, lockfile_path, kit_names, kits):
+    """
+    Pin kits to whatever they have been resolved to
+
+    :param lockfile_path: full path to the lockfile
+    :param kit_names: kit names, as given by the user
+    :param kits: Kits, one per kit name
+    """
+
+    from zenfig import lockfile
+
+    kit_pins = {}
+    for kit_name, _kit in zip(kit_names, kits):
+        kit_pin = lockfile.get_entry(_kit)
+        if kit_pin is not None:
+            kit_pins[kit_name] = kit_pin
+    if kit_pins:
+        lockfile.save(lockfile_path, kit_pins)
 
-        #######################
-        # Render that template!
-        #######################
-        renderer.render_file(
+
+def _prefetch(*, kit_names):
+    """
+    Update a bunch of kits at once
+
+    :param kit_names: names of the kits to be fetched
+    """
+
+    from concurrent.futures import ThreadPoolExecutor
+    from zenfig import kit
+
+    failed_kits = 0
+    max_workers = min(len(kit_names), PREFETCH_MAX_WORKERS)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        fetched_kits = [
+            (kit_name, executor.submit(kit.get_kit, kit_name))
+            for kit_name in kit_names
+        ]
+        for kit_name, fetched_kit in fetched_kits:
+            try:
+                fetched_kit.result()
+                log.msg("Kit '{}' is ready".format(kit_name))
+            except KitException as kit_except:
+                log.msg_err("Kit '{}' could not be fetched: {}".format(
+                    kit_name, kit_except
+                ))
+                failed_kits += 1
+
+    if failed_kits:
+        raise KitException("{} kit(s) could not be fetched".format(failed_kits))
+
+
+def _install(*, options, kits, jobs, var_jobs, kit_manifests):
+    """
+    Render all templates from a bunch of kits
+
+    :param options: list of arguments
+    :param kits: Kits to be rendered
+    :param jobs: Number of templates to be rendered at once
+    :param var_jobs: Number of processes variables are resolved on
+    :param kit_manifests: Kit manifests (if any), one per kit
+    """
+
+    from zenfig import variables
+    from zenfig import renderer
+
+    ########################################
+    # Get user variables:
+    # Facts and variables shared by all kits
+    # are only gathered once
+    ########################################
+    # Independent variables are resolved at once as well
+    kits_vars = variables.get_kits_vars(
+        kits=kits,
+        user_var_files=list(options['--include']),
+        defaults_only=options['--defaults-only'],
+        refresh_facts=options['--refresh-facts'],
+        lazy_facts=True,
+        jobs=var_jobs,
+    )
+
+    #########################
+    # Render those templates!
+    #########################
+    for _kit, user_vars, kit_manifest in zip(kits, kits_vars, kit_manifests):
+        renderer.render_files(
             vars=user_vars,
-            template_file=template_file,
-            template_include_dirs=template_include_dirs,
-            output_file=output_file,
+            templates=list(_kit.templates.values()),
+            preview=options['preview'],
+            jobs=jobs,
+            manifest=kit_manifest,
         )
 
-        # Mark the end of previewed file
-        if options['preview']:
-            log.msg_warn('---')
+        if kit_manifest is not None and not options['preview']:
+            kit_manifest.save()
 
-    # Measure execution time
-    log.msg("Done! ({:.3f} ms)".format((time.time() - start_time)*1000))
+
+def _watch(*, options, kits, jobs, var_jobs, kit_manifests):
+    """
+    Render kits again every time their inputs change
+
+    :param options: list of arguments
+    :param kits: Kits to be rendered
+    :param jobs: Number of templates to be rendered at once
+    :param var_jobs: Number of processes variables are resolved on
+    :param kit_manifests: Kit manifests (if any), one per kit
+    """
+
+    from zenfig import variables
+    from zenfig import watch
+
+    # Variable search paths and all template directories are watched
+    watch_paths = [os.path.join(util.get_data_home(), 'templates')]
+    for _kit in kits:
+        watch_paths.extend(variables.get_search_path(
+            user_var_files=options['--include'],
+            kit=_kit,
+            defaults_only=options['--defaults-only'],
+        ))
+        for template_data in _kit.templates.values():
+            watch_paths.extend(template_data['include'])
+
+    log.msg_warn("Watching for changes (press Ctrl+C to stop) ...")
+    try:
+        for _ in watch.watch(watch_paths):
+            log.msg_warn("Changes detected, rendering again ...")
+            try:
+                _install(
+                    options=options, kits=kits,
+                    jobs=jobs, var_jobs=var_jobs, kit_manifests=kit_manifests
+                )
+            except Exception as e:
+                # Errors (e.g. a half-written variable file)
+                # shouldn't stop this thing
+                _handle_except(e)
+            finally:
+                # Messages from this round are shown right away
+                log.flush()
+    except KeyboardInterrupt:
+        log.msg_warn("Bye!")
+
+
+def _cache(*, options):
+    """
+    Inspect or purge all caches
+
+    :param options: list of arguments
+    """
+
+    for cache_area in cache.CACHE_AREAS:
+        if options['purge']:
+            cache.purge(cache_area)
+        else:
+            cache_files, cache_size = cache.get_cache_info(cache_area)
+            print("{:12} {:6} file(s) {:10.1f} KiB  {}".format(
+                cache_area, cache_files, cache_size / 1024,
+                cache.get_cache_dir(cache_area)
+            ))
 
 
 def _handle_except(e):
@@ -132,12 +375,15 @@ def _handle_except(e):
 
     :param e: exception to be handled
     """
+    import traceback
+
     exc_type, exc_obj, exc_tb = sys.exc_info()
     fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
     log.msg_err("Unhandled {e} at {file}:{line}: '{msg}'" .format(
         e=exc_type.__name__, file=fname,
         line=exc_tb.tb_lineno, msg=e))
-    log.msg_debug(traceback.format_exc())
+    if log.is_enabled(log.LOG_LEVEL_DEBUG):
+        log.msg_debug(traceback.format_exc())
     log.msg_err("An error has occurred!. "
                 "For more details, review the logs.")
     return 1
@@ -169,6 +415,8 @@ def main(argv=None):
         # ... and if everything else fails
         _handle_except(e)
         exit_code = 1
+    finally:
+        log.flush()
 
     return exit_code
 
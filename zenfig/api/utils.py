@@ -55,9 +55,9 @@ def log_msg_err(msg):
 
 @apientry
 def log_msg_debug(msg):
-    """Log a regular message"""
+    """Log a debug message"""
 
-    log.msg_err("*** {}".format(msg))
+    log.msg_debug("*** {}", msg)
 
 ###################################
 # Register all functions on the API
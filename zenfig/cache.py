@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""
+zenfig.cache
+~~~~~~~~
+
+Persistent caches
+
+:copyright: (c) 2016 by Alejandro Ricoveri
+:license: MIT, see LICENSE for more details.
+
+"""
+
+import os
+import shutil
+import pickle
+import hashlib
+import tempfile
+
+from . import log
+from . import util
+from .util import autolog
+
+# Cache areas:
+# Each one of them is a directory under XDG_CACHE_HOME
+CACHE_BYTECODE = 'bytecode'  # compiled templates
+CACHE_VARS = 'vars'  # resolved variables
+CACHE_FACTS = 'facts'  # gathered facts
+CACHE_MANIFESTS = 'manifests'  # rendered kit templates
+CACHE_YAML = 'yaml'  # parsed variable files
+
+# All cache areas managed by zenfig
+CACHE_AREAS = [
+    CACHE_BYTECODE,
+    CACHE_VARS,
+    CACHE_FACTS,
+    CACHE_MANIFESTS,
+    CACHE_YAML,
+]
+
+
+def get_cache_dir(name):
+    """
+    Get the directory of a cache area
+
+    The directory is created if it doesn't exist yet.
+
+    :param name: cache area name
+    :returns: full path to the cache area directory
+    """
+
+    cache_dir = os.path.join(util.get_xdg_cache_home(), name)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+@autolog
+def get_cache_info(name):
+    """
+    Get usage information about a cache area
+
+    :param name: cache area name
+    :returns: a tuple with the number of files and their size in bytes
+    """
+
+    cache_files = 0
+    cache_size = 0
+    for root, dirs, files in os.walk(get_cache_dir(name)):
+        for cache_file in files:
+            cache_files += 1
+            cache_size += os.path.getsize(os.path.join(root, cache_file))
+    return cache_files, cache_size
+
+
+@autolog
+def purge(name):
+    """
+    Wipe out a cache area
+
+    :param name: cache area name
+    """
+
+    cache_dir = get_cache_dir(name)
+    log.msg_warn("Purging cache ({}) ...".format(cache_dir))
+    shutil.rmtree(cache_dir)
+
+
+def get_digest(*objs):
+    """
+    Get a digest out of a bunch of objects
+
+    :param objs: objects to be digested, their repr() is what counts
+    :returns: an hexadecimal digest string
+    """
+
+    return hashlib.sha256(repr(objs).encode('utf-8')).hexdigest()
+
+
+def get_file_fingerprint(path):
+    """
+    Get the fingerprint of a file
+
+    :param path: full path to the file
+    :returns:
+        a tuple with the path, modification time, size and
+        content hash of the file, or only the path if it doesn't exist
+    """
+
+    try:
+        file_stat = os.stat(path)
+        with open(path, 'rb') as f:
+            file_hash = hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return (path,)
+    return (path, file_stat.st_mtime, file_stat.st_size, file_hash)
+
+
+def _get_entry_file(name, slot):
+    return os.path.join(get_cache_dir(name), "{}.pickle".format(slot))
+
+
+def load(name, slot, key):
+    """
+    Load an entry from a cache area
+
+    :param name: cache area name
+    :param slot: name of the entry within the cache area
+    :param key: key the entry must have been stored with
+    :returns: the stored object, None if there is no valid entry
+    """
+
+    try:
+        with open(_get_entry_file(name, slot), 'rb') as f:
+            entry_key, obj = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as exc:
+        log.msg_debug("Invalid cache entry {}/{}: {}", name, slot, exc)
+        return None
+
+    if entry_key != key:
+        return None
+    return obj
+
+
+def store(name, slot, key, obj):
+    """
+    Store an entry on a cache area
+
+    Entries are written atomically, so concurrent readers
+    never get to see a half-written one.
+
+    :param name: cache area name
+    :param slot: name of the entry within the cache area
+    :param key: key identifying the contents of this entry
+    :param obj: object to be stored
+    """
+
+    entry_file = _get_entry_file(name, slot)
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(entry_file))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((key, obj), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, entry_file)
+    except Exception as exc:
+        os.unlink(tmp_file)
+        log.msg_debug("Unable to store cache entry {}/{}: {}", name, slot, exc)
@@ -12,8 +12,12 @@ Dependency graph implementation
 """
 
 from .. import log
+from . import DepGraphException
 from .node import Node
 
+# Smallest number of nodes within a dependency level
+# worth being sent to an executor (see DepGraph.evaluate)
+EXECUTOR_MIN_NODES = 64
 
 
 class DepGraph:
@@ -44,6 +48,9 @@ class DepGraph:
 
         # Create nodes from arbitrary keyword arguments
         self._nodes = {}
+
+        # Nodes inserted for dependencies not defined anywhere
+        self._artificial_nodes = {}
         for key, value in kwargs.items():
             self._nodes[key] = node_class(key, value, depgraph=self)
 
@@ -61,8 +68,12 @@ class DepGraph:
                     # but the thing is that it is simply obnoxious for the user,
                     # so instead, a warning is raised and a node whose value is
                     # an empty string is inserted.
+                    if dep not in self._artificial_nodes:
+                        self._artificial_nodes[dep] = node_class(
+                            dep, "{}_NotImplemented".format(dep), depgraph=self
+                        )
                     log.msg_warn("'{}' is required by '{}' but it is not defined anywhere!.".format(dep, node.key))
-                    node.deps[dep] = node_class(dep, "{}_NotImplemented".format(dep), depgraph=self)
+                    node.deps[dep] = self._artificial_nodes[dep]
 
         # A dictionnary containing all resolved variables
         # from this graph after they have been evaluated
@@ -81,7 +92,7 @@ class DepGraph:
         except KeyError:
             return None
 
-    def evaluate(self):
+    def evaluate(self, *, executor=None, executor_min_nodes=EXECUTOR_MIN_NODES):
         """
         Evaluate all nodes within this graph
 
@@ -91,14 +102,193 @@ class DepGraph:
         in relationship with what their values and dependencies
         have.
 
+        :param executor:
+            A concurrent.futures.Executor, if given, nodes are grouped
+            into dependency levels and all nodes within the same level
+            are evaluated concurrently. Nodes sent to a pool of processes
+            are pickled detached from this graph (see Node.__getstate__)
+        :param executor_min_nodes:
+            Levels holding fewer nodes than this (nodes with no
+            dependencies aside) are evaluated right here instead
         :returns: A dictionary containing all nodes' values
         """
 
-        # One by one, all nodes are evaluated individually
+        # All nodes are evaluated, each one of them exactly once
+        if executor is None:
+            self.evaluate_nodes(self._nodes.values())
+        else:
+            for level in self._get_levels(self._sort(self._nodes.values())):
+                # Nodes with no dependencies (e.g. plain values) are
+                # not worth a trip to the executor, neither are small levels
+                pending = []
+                for node in level:
+                    if node.deps:
+                        pending.append(node)
+                    else:
+                        node.resolve()
+                if len(pending) < executor_min_nodes:
+                    self.evaluate_nodes(pending)
+                    continue
+
+                chunksize = max(1, len(pending) // 32)
+                values = executor.map(_resolve_node, pending, chunksize=chunksize)
+                for node, value in zip(pending, values):
+                    node.set_resolved(value)
+
         for key, node in self._nodes.items():
-            # node.evaluate()
-            # self._resolved[key] = node.value
-            self._resolved[key] = node.evaluate()
+            self._resolved[key] = node.value
 
         # Give that thing already!
         return self._resolved
+
+    def evaluate_nodes(self, nodes):
+        """
+        Evaluate a bunch of nodes along with their dependencies
+
+        :param nodes: nodes to be evaluated
+        """
+
+        for node in self._sort(nodes):
+            node.resolve()
+
+    @staticmethod
+    def _get_levels(order):
+        """
+        Group nodes into dependency levels
+
+        A node's level is one past the highest level among its
+        dependencies, so nodes within the same level don't depend
+        on each other at all.
+
+        :param order: nodes, sorted in evaluation order
+        :returns: a list of levels, each one of them a list of nodes
+        """
+
+        node_levels = {}
+        levels = []
+        for node in order:
+            node_level = 1 + max(
+                (node_levels[dep] for dep in node.deps.values()), default=-1
+            )
+            node_levels[node] = node_level
+            if node_level == len(levels):
+                levels.append([])
+            levels[node_level].append(node)
+        return levels
+
+    @staticmethod
+    def _sort(nodes):
+        """
+        Sort nodes in evaluation order
+
+        This is an iterative implementation of Tarjan's strongly
+        connected components algorithm, so every node (along with
+        its dependencies) is visited exactly once. Components come
+        out in topological order, that is, dependencies first. Any
+        component holding more than one node (or a node depending
+        on itself) is a circular dependency.
+
+        :param nodes: nodes to be sorted
+        :returns: a list of nodes, including all of their dependencies
+        :raises DepGraphException: if there are circular dependencies
+        """
+
+        order = []
+        cycles = []
+
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+
+        for root in nodes:
+            if root in index:
+                continue
+
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(root.deps.values()))]
+
+            while work:
+                node, deps = work[-1]
+
+                for dep in deps:
+                    if dep not in index:
+                        # Descend into this dependency
+                        index[dep] = lowlink[dep] = len(index)
+                        stack.append(dep)
+                        on_stack.add(dep)
+                        work.append((dep, iter(dep.deps.values())))
+                        break
+                    elif dep in on_stack:
+                        lowlink[node] = min(lowlink[node], index[dep])
+                else:
+                    # All dependencies of this node have been visited
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+                    # This node is the root of a component
+                    if lowlink[node] == index[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member is node:
+                                break
+
+                        if len(component) > 1 or node in node.deps.values():
+                            cycles.append(component)
+                        else:
+                            order.append(node)
+
+        if cycles:
+            raise DepGraphException(" ".join(
+                DepGraph._fmt_msg_circ_dep(component) for component in cycles
+            ))
+
+        return order
+
+    @staticmethod
+    def _fmt_msg_circ_dep(component):
+        """
+        Describe a circular dependency
+
+        :param component: strongly connected nodes
+        :returns: an error message showing a cycle within component
+        """
+
+        # Look for the shortest path going from one node
+        # in the component back to itself
+        start = component[-1]
+        members = set(component)
+        parents = {}
+        pending = [start]
+        while pending and start not in parents:
+            next_pending = []
+            for node in pending:
+                for dep in node.deps.values():
+                    if dep in members and dep not in parents:
+                        parents[dep] = node
+                        next_pending.append(dep)
+            pending = next_pending
+
+        cycle = [start]
+        node = parents[start]
+        while node is not start:
+            cycle.append(node)
+            node = parents[node]
+        cycle.append(start)
+
+        msg_err = "Circular dependency detected! "
+        msg_err += " ~> ".join(node.key for node in reversed(cycle))
+        return msg_err
+
+
+def _resolve_node(node):
+    """Evaluate a node whose dependencies are already evaluated"""
+
+    return node.resolve()
@@ -12,8 +12,6 @@ Node implementation
 """
 
 
-from . import DepGraphException
-
 class Node:
     """
     Graph node implementation
@@ -97,30 +95,57 @@ class Node:
 
         raise NotImplementedError("You must implement this method")
 
-    def evaluate(self, *seen):
+    def __getstate__(self):
+        """
+        Nodes are pickled detached from their graph
+
+        This way, nodes can be evaluated by other processes:
+        only their own value and their dependencies' values
+        travel along with them.
+        """
+
+        state = self.__dict__.copy()
+        state['_depgraph'] = None
+        state['_deps'] = {
+            dep_name: dep_node._detach()
+            for dep_name, dep_node in self._deps.items()
+        }
+        return state
+
+    def _detach(self):
+        """Get a copy of this node with no graph and no dependencies"""
+
+        node = self.__class__.__new__(self.__class__)
+        node.__dict__.update(self.__dict__)
+        node._depgraph = None
+        node._deps = {}
+        return node
+
+    def evaluate(self):
         """
         Evaluate this node (the real implementation)
 
-        This method is called by this node's parent DepGraph
-        at evaluation time. It basically manages to resolve
-        all dependencies for then settle down this node's value.
+        It basically manages to resolve all dependencies for
+        then settle down this node's value. Dependencies are
+        evaluated by this node's parent DepGraph, in order.
+
+        :returns: this node's value
         """
 
-        # First of all, before a node's value can be evaluated,
-        # its dependencies HAVE to be evaluated first
-        for dep_name, dep_node in self._deps.items():
-            # at some point during dependencies evaluation, one
-            # of them could be already have been evaluated, meaning
-            # one thing: circular dependency.
-            if dep_name in seen:
-                raise DepGraphException(self._fmt_msg_circ_dep(dep_name, seen))
+        if not self._evaluated:
+            self._depgraph.evaluate_nodes([self])
+        return self.value
 
-            # If everything is good, put this dependency on the
-            # tracked ones list
-            seen += (dep_name,)
+    def resolve(self):
+        """
+        Settle down this node's value
 
-            # Actually evaluate this dependency
-            dep_node.evaluate(*seen)
+        This method is called by this node's parent DepGraph
+        at evaluation time, once all of this node's dependencies
+        have been evaluated.
+
+        :returns: this node's value
+        """
 
         # Don't even bother to evaluate this node if it's been
         # already evaluated.
@@ -136,10 +161,15 @@ class Node:
         # Finally, give back this node's value
         return self.value
 
-    @staticmethod
-    def _fmt_msg_circ_dep(dep_name, seen):
-        msg_err = "Circular dependency detected! "
-        for dep in seen:
-            msg_err += "{} ~> ".format(dep)
-        msg_err += dep_name
-        return msg_err
+    def set_resolved(self, value):
+        """
+        Settle down this node's value from elsewhere
+
+        This is used by this node's parent DepGraph whenever
+        this node has been evaluated by another process.
+
+        :param value: this node's evaluated value
+        """
+
+        self._evaluated = True
+        self.value = value
@@ -16,12 +16,56 @@ import re
 
 from . import log
 from .util import autolog
-from .kits import git, local, KitException
+from .kits import archive, git, local, KitException
 from .kits.git import GitRepoKit
 
 
+def get_provider(kit_name):
+    """
+    Find out which kit provider kit_name belongs to
+
+    Nothing gets loaded nor fetched in here.
+
+    :param kit_name: Name of the kit
+    :returns:
+        a tuple with the kit provider (module), the kit name
+        and the kit version requested by the user (if any)
+    """
+
+    # Local kit version requested by the user
+    kit_version = None
+
+    # test whether kit_name is an archive (e.g. kit.tar.gz)
+    if archive.is_archive(kit_name):
+        log.msg_debug("Using '{}' as archive", kit_name)
+        provider = archive
+
+    # test whether kit_name is a absolute directory
+    elif re.match("^\/", kit_name):
+        log.msg_debug("Using '{}' as absolute directory", kit_name)
+        provider = local
+
+    # test whether kit_name is a relative directory
+    elif os.path.isdir(os.path.join(os.getcwd(), kit_name)):
+        log.msg_debug("Using '{}' as relative directory", kit_name)
+        provider = local
+
+    # see whether kit_name matches git kit criteria
+    elif re.match(GitRepoKit.RE_GIT_REPO_SHORT, kit_name) \
+    or re.match(GitRepoKit.RE_GIT_REPO_URL, kit_name):
+        if re.match('.*==.*', kit_name):
+            kit_name, kit_version = kit_name.split('==')
+        provider = git
+
+    # when everything else fails ...
+    else:
+        raise KitException("'{}' is not a valid provider".format(kit_name))
+
+    return provider, kit_name, kit_version
+
+
 @autolog
-def get_kit(kit_name, *, provider=None):
+def get_kit(kit_name, *, provider=None, pin=None):
     """
     Initialize kit interface
 
@@ -30,6 +74,7 @@ def get_kit(kit_name, *, provider=None):
 
     :param kit_name: Name of the kit to be loaded
     :param provider: Kit provider to be used to load kit_name
+    :param pin: lockfile entry pinning the kit (see zenfig.lockfile)
     :returns: a Kit holding all relevant information about kit_name
     """
 
@@ -39,30 +84,10 @@ def get_kit(kit_name, *, provider=None):
     # if provider has not been enforced
     # then, deduct proper provider for kit_name
     if provider is None:
-
-        # test whether kit_name is a absolute directory
-        if re.match("^\/", kit_name):
-            log.msg_debug("Using '{}' as absolute directory".format(kit_name))
-            provider = local
-
-        # test whether kit_name is a relative directory
-        elif os.path.isdir(os.path.join(os.getcwd(), kit_name)):
-            log.msg_debug("Using '{}' as relative directory".format(kit_name))
-            provider = local
-
-        # see whether kit_name matches git kit criteria
-        elif re.match(GitRepoKit.RE_GIT_REPO_SHORT, kit_name) \
-        or re.match(GitRepoKit.RE_GIT_REPO_URL, kit_name):
-            if re.match('.*==.*', kit_name):
-                kit_name, kit_version = kit_name.split('==')
-            provider = git
-
-        # when everything else fails ...
-        else:
-            raise KitException("'{}' is not a valid provider".format(provider))
+        provider, kit_name, kit_version = get_provider(kit_name)
     else:
         provider = local
-        log.msg_debug("Kit provider '{}' has been imposed!".format(provider))
+        log.msg_debug("Kit provider '{}' has been imposed!", provider)
 
     # Get a Kit instance from the provider
-    return provider.get_kit(kit_name, kit_version)
+    return provider.get_kit(kit_name, kit_version, pin=pin)
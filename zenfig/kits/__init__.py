@@ -12,10 +12,8 @@ Some message
 """
 
 import os
-import yaml
-from voluptuous import Schema, Optional
 
-from ..util import autolog
+from ..util import autolog, yaml_load
 
 class KitException(BaseException):
     """Basic Kit exception"""
@@ -79,6 +77,7 @@ class Kit:
         #####################################################
         # Index files from kits must obey a schema as follows
         #####################################################
+        from voluptuous import Schema, Optional
         schema = Schema({
             # Kit author name
             'author': str,
@@ -110,8 +109,7 @@ class Kit:
         }, required=True)
 
         # Attempt to open the index file:
-        with open(self._index_file, 'r') as file:
-            self._index_data = schema(yaml.load(file))
+        self._index_data = schema(yaml_load(self._read_file(self._index_file)))
 
         ###################################################
         # All templates have their base templates directory
@@ -156,6 +154,11 @@ class Kit:
         # YAML files within its 'defaults' directory
         self._var_dirs = os.path.join(self._root_dir, 'defaults')
 
+    @property
+    def name(self):
+        """Kit name"""
+        return self._name
+
     @property
     def index_data(self):
         return self._index_data
@@ -179,12 +182,20 @@ class Kit:
         """Kit templates descriptions"""
         return self._templates
 
-    @staticmethod
-    def _check_filesystem(root_dir, kit_name):
+    def _is_dir(self, path):
+        """Tell whether a path within this kit is a directory"""
+        return os.path.isdir(path)
+
+    def _read_file(self, path):
+        """Read a file within this kit"""
+        with open(path, 'r') as file:
+            return file.read()
+
+    def _check_filesystem(self, root_dir, kit_name):
         """Check whether this kit is actually a valid one"""
-        if not os.path.isdir(root_dir):
+        if not self._is_dir(root_dir):
             raise KitException("Kit '{}' doesn't have a valid base directory".format(kit_name))
-        if not os.path.isdir("{}/templates".format(root_dir)):
+        if not self._is_dir("{}/templates".format(root_dir)):
             raise KitException("Kit '{}' must have a templates directory".format(kit_name))
-        if not os.path.isdir("{}/defaults".format(root_dir)):
+        if not self._is_dir("{}/defaults".format(root_dir)):
             raise KitException("Kit '{}' must have a defaults directory".format(kit_name))
@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+
+"""
+zenfig.kits.archive
+~~~~~~~~
+
+Archive kit provider
+
+Kits can be distributed as archives (.tar.gz, .tar.zst, .zip), which
+are used as they are, no extraction involved. Paths to files within
+an archive are written as if the archive was a directory
+(e.g. /srv/kits/i3.tar.gz/templates/i3/main.j2).
+
+:copyright: (c) 2016 by Alejandro Ricoveri
+:license: MIT, see LICENSE for more details.
+
+"""
+
+import os
+import hashlib
+import posixpath
+import tarfile
+import threading
+import zipfile
+
+import jinja2
+
+from . import Kit, KitException
+
+from .. import log
+from ..util import autolog
+
+# zstandard is only needed for .tar.zst kits,
+# it comes along with the 'zst' extra (pip install zenfig[zst])
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Archive kits can't be pinned on lockfiles
+PINNABLE = False
+
+# Supported archive formats
+ARCHIVE_SUFFIXES_TAR_GZ = ('.tar.gz', '.tgz')
+ARCHIVE_SUFFIXES_TAR_ZST = ('.tar.zst', '.tzst')
+ARCHIVE_SUFFIXES_ZIP = ('.zip',)
+ARCHIVE_SUFFIXES = \
+    ARCHIVE_SUFFIXES_TAR_GZ + ARCHIVE_SUFFIXES_TAR_ZST + ARCHIVE_SUFFIXES_ZIP
+
+
+class KitArchive:
+    """
+    In-memory index of an archive
+
+    Archives are read only once: tarballs (which can't be read
+    at random) get all of their files loaded in memory in a single
+    pass, while zip files are read on demand.
+    """
+
+    def __init__(self, path):
+        """
+        Constructor
+
+        :param path: full path to the archive
+        """
+
+        self._path = path
+        file_stat = os.stat(path)
+        self._stat = (file_stat.st_mtime, file_stat.st_size)
+
+        # Member names (without leading './' or trailing '/')
+        # along with their contents (tarballs) or ZipInfos (zip files)
+        self._files = {}
+        self._dirs = {''}
+        self._zip_file = None
+        self._lock = threading.Lock()
+
+        if path.endswith(ARCHIVE_SUFFIXES_ZIP):
+            self._index_zip()
+        else:
+            self._index_tar()
+
+    @property
+    def path(self):
+        """Full path to the archive"""
+        return self._path
+
+    @property
+    def stat(self):
+        """A tuple with both modification time and size of the archive"""
+        return self._stat
+
+    def _add_dir(self, name):
+        while name and name not in self._dirs:
+            self._dirs.add(name)
+            name = posixpath.dirname(name)
+
+    def _add_file(self, name, data):
+        name = posixpath.normpath(name).lstrip('/')
+        if name.startswith('..'):
+            return
+        self._files[name] = data
+        self._add_dir(posixpath.dirname(name))
+
+    def _index_zip(self):
+        self._zip_file = zipfile.ZipFile(self._path)
+        for zip_info in self._zip_file.infolist():
+            if zip_info.is_dir():
+                self._add_dir(posixpath.normpath(zip_info.filename).lstrip('/'))
+            else:
+                self._add_file(zip_info.filename, zip_info)
+
+    def _index_tar(self):
+        with open(self._path, 'rb') as f:
+            if self._path.endswith(ARCHIVE_SUFFIXES_TAR_ZST):
+                if zstandard is None:
+                    raise KitException(
+                        "zstandard is needed in order to use '{}', "
+                        "install it (e.g. pip install zenfig[zst]) and try again"
+                        .format(self._path)
+                    )
+                tar_stream = zstandard.ZstdDecompressor().stream_reader(f)
+                tar_mode = 'r|'
+            else:
+                tar_stream = f
+                tar_mode = 'r|gz'
+
+            # Tarballs are read in a single pass, as a stream
+            with tarfile.open(fileobj=tar_stream, mode=tar_mode) as tar:
+                for member in tar:
+                    if member.isdir():
+                        self._add_dir(posixpath.normpath(member.name).lstrip('/'))
+                    elif member.isfile():
+                        self._add_file(member.name, tar.extractfile(member).read())
+
+    def _normalize(self, name):
+        name = posixpath.normpath(name).lstrip('/')
+        return '' if name == '.' else name
+
+    def is_dir(self, name):
+        """Tell whether a member is a directory"""
+        return self._normalize(name) in self._dirs
+
+    def is_file(self, name):
+        """Tell whether a member is a file"""
+        return self._normalize(name) in self._files
+
+    def list_files(self, name):
+        """
+        List all files inside a directory
+
+        :param name: directory member name
+        :returns: a sorted list of member names
+        """
+
+        name = self._normalize(name)
+        return sorted(
+            file_name for file_name in self._files
+            if posixpath.dirname(file_name) == name
+        )
+
+    def walk_files(self, name):
+        """
+        List all files inside a directory and its subdirectories
+
+        :param name: directory member name
+        :returns: a sorted list of member names, relative to name
+        """
+
+        name = self._normalize(name)
+        prefix = name + '/' if name else ''
+        return sorted(
+            file_name[len(prefix):] for file_name in self._files
+            if file_name.startswith(prefix)
+        )
+
+    def read(self, name):
+        """
+        Read a file
+
+        :param name: file member name
+        :returns: file contents, as bytes
+        """
+
+        try:
+            data = self._files[self._normalize(name)]
+        except KeyError:
+            raise FileNotFoundError(os.path.join(self._path, name)) from None
+        if isinstance(data, zipfile.ZipInfo):
+            with self._lock:
+                data = self._zip_file.read(data)
+        return data
+
+    def is_uptodate(self):
+        """Tell whether the archive has not changed since it was indexed"""
+
+        try:
+            file_stat = os.stat(self._path)
+        except OSError:
+            return False
+        return (file_stat.st_mtime, file_stat.st_size) == self._stat
+
+
+# Archives indexed so far, keyed by their full paths
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def is_archive(path):
+    """Tell whether a path is an archive kit"""
+
+    return path.endswith(ARCHIVE_SUFFIXES) and os.path.isfile(path)
+
+
+def get_archive(path):
+    """
+    Get the index of an archive
+
+    Archives are indexed once, unless they change.
+
+    :param path: full path to the archive
+    :returns: a KitArchive
+    """
+
+    with _archives_lock:
+        kit_archive = _archives.get(path)
+        if kit_archive is None or not kit_archive.is_uptodate():
+            log.msg_debug("Indexing archive '{}'", path)
+            kit_archive = KitArchive(path)
+            _archives[path] = kit_archive
+        return kit_archive
+
+
+def split_path(path):
+    """
+    Split a path to a file within an archive
+
+    :param path: full path
+    :returns:
+        a tuple with the KitArchive and the member name,
+        None if the path is not within an archive
+    """
+
+    for suffix in ARCHIVE_SUFFIXES:
+        index = path.find(suffix + os.sep)
+        while index != -1:
+            archive_path = path[:index + len(suffix)]
+            if os.path.isfile(archive_path):
+                return get_archive(archive_path), path[len(archive_path) + 1:]
+            index = path.find(suffix + os.sep, index + 1)
+    if is_archive(path):
+        return get_archive(path), ''
+    return None
+
+
+def list_files(path):
+    """
+    List all files inside a directory within an archive
+
+    :param path: full path to a directory within an archive
+    :returns: a sorted list of full paths
+    """
+
+    kit_archive, member = split_path(path)
+    return [
+        os.path.join(kit_archive.path, file_name)
+        for file_name in kit_archive.list_files(member)
+    ]
+
+
+def read_file(path):
+    """
+    Read a file within an archive
+
+    :param path: full path to a file within an archive
+    :returns: a tuple with the file contents (bytes) and the archive stat
+    """
+
+    kit_archive, member = split_path(path)
+    return kit_archive.read(member), kit_archive.stat
+
+
+def get_file_fingerprint(path):
+    """
+    Get the fingerprint of a file within an archive
+
+    :param path: full path to a file within an archive
+    :returns: just like cache.get_file_fingerprint
+    """
+
+    try:
+        file_data, (mtime, size) = read_file(path)
+    except OSError:
+        return (path,)
+    return (path, mtime, size, hashlib.sha1(file_data).hexdigest())
+
+
+class ArchiveLoader(jinja2.BaseLoader):
+    """Load templates straight from a directory within an archive"""
+
+    def __init__(self, search_path):
+        """
+        Constructor
+
+        :param search_path: full path to a directory within an archive
+        """
+
+        kit_archive, self._member_dir = split_path(search_path)
+        self._path = kit_archive.path
+
+    def get_source(self, environment, template):
+        # The archive could have changed since the last time
+        kit_archive = get_archive(self._path)
+
+        pieces = jinja2.loaders.split_template_path(template)
+        member = posixpath.join(self._member_dir, *pieces)
+        if not kit_archive.is_file(member):
+            raise jinja2.TemplateNotFound(template)
+
+        source = kit_archive.read(member).decode('utf-8')
+        filename = os.path.join(kit_archive.path, member)
+        return source, filename, kit_archive.is_uptodate
+
+    def list_templates(self):
+        return get_archive(self._path).walk_files(self._member_dir)
+
+
+class ArchiveKit(Kit):
+    """Kit as archive"""
+
+    def _is_dir(self, path):
+        kit_path = split_path(path)
+        return kit_path is not None and kit_path[0].is_dir(kit_path[1])
+
+    def _read_file(self, path):
+        return read_file(path)[0].decode('utf-8')
+
+
+def _get_root_dir(kit_archive):
+    """Find out where the kit is within an archive"""
+
+    # Kits can be either at the very top of the archive
+    # or inside a single directory (e.g. i3-1.0/)
+    if kit_archive.is_file('index.yml'):
+        return kit_archive.path
+    for file_name in kit_archive.walk_files(''):
+        if posixpath.basename(file_name) == 'index.yml' and \
+        file_name.count('/') == 1:
+            return os.path.join(kit_archive.path, posixpath.dirname(file_name))
+    raise KitException(
+        "'{}' doesn't hold a kit (index.yml not found)".format(kit_archive.path)
+    )
+
+
+@autolog
+def get_kit(kit_name, kit_version=None, pin=None):
+    """
+    Initialise kit provider
+
+    Archives can't be pinned, so both kit_version and pin are ignored
+    """
+
+    kit_archive = get_archive(os.path.abspath(kit_name))
+    return ArchiveKit(kit_name, root_dir=_get_root_dir(kit_archive))
@@ -12,43 +12,85 @@ Git kit interface
 """
 
 import os
-import shutil
 import re
+import shutil
+import tempfile
 from time import time
 from base64 import standard_b64encode
 
-import git
-from git.exc import InvalidGitRepositoryError
-from git.exc import GitCommandError
-
 from . import Kit, KitException
 
 from .. import log
 from .. import util
 from ..util import autolog
 
+# Git kits can be pinned to commits on lockfiles
+PINNABLE = True
+
 class GitRepoKit(Kit):
     """Kit as git repository"""
 
     # Regular expression for catching git repositories
     RE_GIT_REPO_SHORT = "^[a-zA-Z0-9\-_]+\/[a-zA-Z0-9\-_]+(==[a-zA-Z0-9-_.]+)?$"
-    RE_GIT_REPO_URL = "^http.*\.git+(==[a-zA-Z0-9-_.]+)?$"
+    RE_GIT_REPO_URL = "^(http|file).*\.git+(==[a-zA-Z0-9-_.]+)?$"
 
     # Essential git repo variables
     GIT_REPO_PREFIX_DEFAULT = "https://github.com"
 
-    # Git reference type to use
-    GIT_REF_TAG = 1
-    GIT_REF_HEAD = 2
+    # Fetched refs are kept locally under this namespace,
+    # depending on what they were on the remote repo
+    GIT_REF_PREFIX = "refs/zenfig"
+    GIT_REF_HEADS = "heads"
+    GIT_REF_TAGS = "tags"
+    GIT_REF_COMMITS = "commits"
 
-    # Kit cache location
+    # Regular expression for full commit SHAs
+    RE_GIT_COMMIT = "^[0-9a-f]{40}$"
+
+    # Only the tip of the requested ref is fetched
+    GIT_FETCH_DEPTH = 1
+
+    # Environment variable holding an optional object filter for fetches
+    # (e.g. 'blob:limit=1m'), see --filter on git-fetch(1)
+    GIT_FETCH_FILTER_ENV = "ZF_KIT_FILTER"
+
+    # Kit cache location:
+    # * CACHE_HOME/repos: a bare git repository per kit,
+    #   holding all objects ever fetched for it
+    # * CACHE_HOME/trees: an immutable, read-only tree per commit,
+    #   which is what kits are actually loaded from
     CACHE_HOME = "{}/kits".format(util.get_xdg_cache_home())
+    CACHE_REPOS = "repos"
+    CACHE_TREES = "trees"
+
+    # Maximum size (in bytes) of all trees, least recently
+    # used trees are wiped out whenever it is exceeded
+    CACHE_TREES_MAX_SIZE = 256 * 1024 * 1024  # 256 MiB
 
-    # Kit cache maximum allowed modification time in cache
-    CACHE_MAX_TIME = 259200  # 3 days
+    # Environment variable overriding CACHE_TREES_MAX_SIZE (in MiB)
+    CACHE_TREES_MAX_SIZE_ENV = "ZF_KIT_STORE_SIZE"
 
-    def __init__(self, kit_name, *, version=None):
-        """ Constructor """
+    # Trees used since then (in seconds) are never wiped out,
+    # as other zenfig processes could be using them
+    CACHE_TREES_KEEP_TIME = 86400  # 1 day
+
+    # Time (in seconds) during which branches are not even
+    # checked for changes since the last time they were
+    CACHE_MAX_TIME = 3600  # 1 hour
+
+    # Environment variable overriding CACHE_MAX_TIME
+    CACHE_MAX_TIME_ENV = "ZF_KIT_TTL"
+
+    def __init__(self, kit_name, *, version=None, pin=None):
+        """
+        Constructor
+
+        :param kit_name: kit name, either <user_name>/<repo_name> or an URL
+        :param version: branch, tag or commit to be used
+        :param pin:
+            lockfile entry (see zenfig.lockfile) pinning this kit to a commit,
+            if given, version is not resolved at all
+        """
 
         # Kit version requested by user
         self._version = version
@@ -68,21 +110,52 @@ class GitRepoKit(Kit):
         # These are used for git operations on local kit cache
         self._git_remote = None
         self._git_ref = None
-        self._git_ref_type = None
-
-        try:
-            # Proceed to update local kit cache
-            self._cache_update(kit_name)
+        self._git_commit = None
+
+        # Tree holding the requested commit
+        self._tree_path = None
+        self._git_tree = None
+
+        # Kit pinned to a commit:
+        # should its tree be already there, git is not involved at all
+        self._pin = pin
+        if self._pin is not None:
+            # Lockfiles can be edited by hand, and pinned
+            # commits end up being part of paths on the cache
+            if not re.match(self.RE_GIT_COMMIT, str(self._pin['commit'])):
+                raise KitException(
+                    "Invalid commit pinned for '{}': {}"
+                    .format(kit_name, self._pin['commit'])
+                )
+            tree_path = self._get_tree_path(self._pin['commit'])
+            if os.path.isdir(tree_path):
+                log.msg_debug("Using pinned tree {}", tree_path)
+                os.utime(tree_path)
+                self._git_commit = self._pin['commit']
+                self._git_tree = self._pin['tree']
+                self._tree_path = tree_path
+                super().__init__(kit_name, root_dir=self._tree_path)
+                return
+
+            # ... otherwise, the commit itself is fetched
+            self._version = self._pin['commit']
+
+        # Several zenfig processes could be dealing with the
+        # same kit at once, they take turns on its local cache
+        with util.file_lock(self._get_lock_file()):
+            try:
+                # Proceed to update local kit cache
+                self._cache_update(kit_name)
 
-            # Call my parent
-            super().__init__(kit_name, root_dir=self._git_repo_path)
+                # Call my parent
+                super().__init__(kit_name, root_dir=self._tree_path)
 
-        except KitException as kit_except:
+            except KitException as kit_except:
 
-            # Destroy kit if invalid
-            if not self._cache_isvalid():
-                self._cache_destroy_kit()
-            raise kit_except
+                # Destroy kit if invalid
+                if not self._cache_isvalid():
+                    self._cache_destroy_kit()
+                raise kit_except
 
     def _get_repo_name(self, kit_name):
         """Generate repo name and its URL"""
@@ -105,6 +178,11 @@ class GitRepoKit(Kit):
     def _cache_update(self, kit_name):
         """Update kit cache"""
 
+        # GitPython takes a while to load, so it is only
+        # brought in whenever a git kit is actually used
+        import git
+        from git.exc import InvalidGitRepositoryError
+
         try:
             #####################################
             # First of all, perform sanity checks
@@ -121,44 +199,30 @@ class GitRepoKit(Kit):
                 self._git_repo = git.Repo(self._git_repo_path)
 
                 # log the thing
-                log.msg_debug("Updating kit: {}@{}".format(kit_name, self._version))
-
+                log.msg_debug("Updating kit: {}@{}", kit_name, self._version)
 
-            # This kit provider deals with remote refs from 'origin'
-            # directly, namely, it locates them and checks them out
-            # for further use by zenfig
+            # This kit provider fetches the requested ref from 'origin'
+            # directly (and nothing else), namely, it keeps it locally
+            # and exports its tree for further use by zenfig
 
             # 'origin' is used as the remote
             self._git_remote = self._git_repo.remotes.origin
 
-            # Determine whether self._version is either a
-            # branch or a tag reference
-            if self._version in self._git_remote.refs:
-                self._git_ref_type = self.GIT_REF_HEAD
-                self._git_ref = self._git_remote.refs[self._version]
-            elif self._version in self._git_repo.tags:
-                self._git_ref_type = self.GIT_REF_TAG
-                self._git_ref = self._git_repo.tags[self._version]
-            else:
+            # Fetch latest changes from the remote repo
+            self._cache_kit_fetch()
+
+            # Pinned commits must be exactly what they were
+            if self._pin is not None and self.tree != self._pin['tree']:
                 raise KitException(
-                    "Ref '{}' not found on git repository".format(self._version)
+                    "Tree of commit {} doesn't match the one it was pinned to"
+                    .format(self._git_commit)
                 )
 
-            # Pull latest changes from the remote repo
-            self._cache_kit_pull()
-
             #################################################
-            # Proceed to actual checkout of the specified ref
+            # Get the tree of the specified ref
+            # (unless it is already there)
             #################################################
-            try:
-                if self._git_ref_type == self.GIT_REF_TAG:
-                    self._git_ref.ref.checkout(force=True)
-                self._git_ref.checkout(force=True)
-            except TypeError:
-                # Dealing with remote references on GitPython
-                # raises TypeError exceptions, which in this case,
-                # are irrelevant
-                pass
+            self._tree_path = self._cache_get_tree()
 
         except InvalidGitRepositoryError:
             ################################################
@@ -185,7 +249,7 @@ class GitRepoKit(Kit):
 
         # Proceed to create entire kit cache file system
         # which is located at XDG_self.CACHE_HOME/zenfig/kits
-        log.msg_debug("Creating local kit cache at '{}'".format(self._git_repo_path))
+        log.msg_debug("Creating local kit cache at '{}'", self._git_repo_path)
         os.makedirs(self._git_repo_path)
 
         ########################################################
@@ -199,12 +263,22 @@ class GitRepoKit(Kit):
         return self._clone_repo()
 
     def _clone_repo(self):
+        """
+        Set up an empty kit repository
+
+        Nothing is actually fetched in here, only the
+        requested ref is fetched later on (see _cache_kit_fetch)
+
+        :returns: a git repository whose 'origin' is the kit repository
+        """
+
+        import git
+
         try:
-            log.msg_warn("Cloning kit repository: {}".format(self._git_repo_url))
-            return git.Repo.clone_from(
-                url=self._git_repo_url,
-                to_path=self._git_repo_path,
-            )
+            log.msg_debug("Setting up kit repository for {}", self._git_repo_url)
+            git_repo = git.Repo.init(self._git_repo_path, bare=True)
+            git_repo.create_remote('origin', self._git_repo_url)
+            return git_repo
         except:
             raise KitException(
                 "Unable to clone kit repository at {}"
@@ -233,22 +307,317 @@ class GitRepoKit(Kit):
         # OK, it's good to go!
         return True
 
+    def _get_stamp_file(self):
+        """Get the file telling when the requested ref was last checked"""
+
+        return os.path.join(
+            self._git_repo.git_dir, 'zenfig', 'stamps', self._version
+        )
+
+    def _cache_touch(self):
+        """Record that the requested ref has just been checked"""
+
+        stamp_file = self._get_stamp_file()
+        os.makedirs(os.path.dirname(stamp_file), exist_ok=True)
+        with open(stamp_file, 'w'):
+            pass
+
+    def _get_cache_max_time(self):
+        """Get the time (in seconds) branches are considered fresh"""
+
+        cache_max_time = os.getenv(self.CACHE_MAX_TIME_ENV)
+        if cache_max_time is None:
+            return self.CACHE_MAX_TIME
+        try:
+            return int(cache_max_time)
+        except ValueError:
+            log.msg_warn(
+                "{} must be a number of seconds, ignoring it"
+                .format(self.CACHE_MAX_TIME_ENV)
+            )
+            return self.CACHE_MAX_TIME
+
     def _cache_is_too_old(self):
-        """Tell whether a git repository for kit_name is too old"""
-
-        ################################################
-        # base on directory's modification time
-        # tell whether or not this kit should be updated
-        ################################################
-        return os.path.getmtime(
-            self._git_repo_path) < (time() - self.CACHE_MAX_TIME
+        """Tell whether the requested ref should be checked for changes"""
+
+        try:
+            return os.path.getmtime(self._get_stamp_file()) < \
+                (time() - self._get_cache_max_time())
+        except OSError:
+            return True
+
+    def _get_local_ref(self):
+        """
+        Get the requested ref on the local cache
+
+        :returns:
+            a tuple with the local ref name and the commit it points to,
+            (None, None) if the ref has not been fetched yet
+        """
+
+        # Branches take precedence over tags
+        local_refs = [
+            "{}/{}/{}".format(self.GIT_REF_PREFIX, ref_kind, self._version)
+            for ref_kind in [
+                self.GIT_REF_HEADS, self.GIT_REF_TAGS, self.GIT_REF_COMMITS
+            ]
+        ]
+        found_refs = {}
+        for line in self._git_repo.git.for_each_ref(
+            '--format=%(refname) %(objectname) %(*objectname)', *local_refs
+        ).splitlines():
+            ref_name, commit, *peeled_commit = line.split()
+            found_refs[ref_name] = peeled_commit[0] if peeled_commit else commit
+
+        for local_ref in local_refs:
+            if local_ref in found_refs:
+                return local_ref, found_refs[local_ref]
+        return None, None
+
+    def _get_remote_ref(self):
+        """
+        Find out what the requested ref is on the remote repo
+
+        :returns:
+            a tuple with the remote ref name, the kind of ref it is
+            and the object it points to
+        """
+
+        remote_refs = {}
+        for line in self._git_repo.git.ls_remote(
+            'origin',
+            "refs/heads/{}".format(self._version),
+            "refs/tags/{}".format(self._version),
+        ).splitlines():
+            commit, ref_name = line.split()
+            remote_refs[ref_name] = commit
+
+        for ref_kind in [self.GIT_REF_HEADS, self.GIT_REF_TAGS]:
+            ref_name = "refs/{}/{}".format(ref_kind, self._version)
+            if ref_name in remote_refs:
+                return ref_name, ref_kind, remote_refs[ref_name]
+
+        # Plain commits can be fetched as well
+        if re.match(self.RE_GIT_COMMIT, self._version):
+            return self._version, self.GIT_REF_COMMITS, self._version
+
+        raise KitException(
+            "Ref '{}' not found on git repository".format(self._version)
         )
 
-    def _cache_kit_pull(self):
-        """Pull latest changes from the remote repo"""
+    def _cache_kit_fetch(self):
+        """Fetch latest changes of the requested ref from the remote repo"""
+
+        from git.exc import GitCommandError
+
+        self._git_ref, self._git_commit = self._get_local_ref()
+        if self._git_ref is not None:
+            # Tags and commits are not supposed to change, ever
+            if not self._git_ref.startswith("{}/{}/".format(
+                self.GIT_REF_PREFIX, self.GIT_REF_HEADS
+            )):
+                return
 
-        if self._cache_is_too_old():
-            self._git_remote.pull(refspec=self._git_ref)
+            # Branches are checked every now and then
+            if not self._cache_is_too_old():
+                return
+
+        try:
+            remote_ref, ref_kind, remote_commit = self._get_remote_ref()
+        except GitCommandError:
+            # Whatever has been fetched before will do
+            if self._git_ref is not None:
+                log.msg_warn(
+                    "Unable to reach {}, using cached kit"
+                    .format(self._git_repo_url)
+                )
+                return
+            raise KitException(
+                "Unable to reach kit repository at {}"
+                .format(self._git_repo_url)
+            )
+
+        # Nothing new under the sun
+        if remote_commit == self._git_commit:
+            log.msg_debug(
+                "{}@{} is up to date", self._git_repo_url, self._version
+            )
+            self._cache_touch()
+            return
+
+        # Only the tip of the requested ref is fetched:
+        # no history, no other branches, no tags
+        fetch_args = [
+            '--depth={}'.format(self.GIT_FETCH_DEPTH), '--no-tags',
+        ]
+
+        # Partial clone
+        fetch_filter = os.getenv(self.GIT_FETCH_FILTER_ENV)
+        if fetch_filter:
+            self._git_repo.git.config('remote.origin.promisor', 'true')
+            self._git_repo.git.config('remote.origin.partialclonefilter', fetch_filter)
+            fetch_args.append('--filter={}'.format(fetch_filter))
+
+        local_ref = "{}/{}/{}".format(self.GIT_REF_PREFIX, ref_kind, self._version)
+        # This is where kits actually hit the network
+        log.msg_warn("Fetching kit: {}@{}", self._git_repo_url, self._version)
+        try:
+            self._git_repo.git.fetch(
+                *fetch_args, 'origin', '+{}:{}'.format(remote_ref, local_ref)
+            )
+        except GitCommandError:
+            raise KitException(
+                "Unable to fetch '{}' from {}"
+                .format(self._version, self._git_repo_url)
+            )
+        self._git_ref = local_ref
+        self._git_commit = self._git_repo.git.rev_parse(
+            '{}^{{commit}}'.format(local_ref)
+        )
+        self._cache_touch()
+
+    def _get_tree_path(self, commit):
+        return os.path.join(self.CACHE_HOME, self.CACHE_TREES, commit)
+
+    def _cache_get_tree(self):
+        """
+        Get the tree of the requested commit
+
+        Trees are exported only once per commit, read-only,
+        so switching between versions of a kit is nothing but
+        a directory lookup.
+
+        :returns: full path to the tree
+        """
+
+        tree_path = self._get_tree_path(self._git_commit)
+        if os.path.isdir(tree_path):
+            # Keep track of its last use
+            os.utime(tree_path)
+            return tree_path
+
+        log.msg_debug("Exporting tree {}", self._git_commit)
+
+        # Trees are exported aside, only complete ones are put in place
+        trees_path = os.path.dirname(tree_path)
+        os.makedirs(trees_path, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=trees_path, prefix='.')
+        try:
+            self._checkout_tree(tmp_path)
+        except BaseException:
+            _remove_tree(tmp_path)
+            raise
+        _set_read_only(tmp_path)
+        try:
+            os.rename(tmp_path, tree_path)
+        except OSError:
+            # Some other process got there first
+            _remove_tree(tmp_path)
+            return tree_path
+
+        self._cache_collect_trees(keep_tree=tree_path)
+        return tree_path
+
+    def _checkout_tree(self, path):
+        """
+        Check out the requested commit into a directory
+
+        Files are checked out through a throwaway index, as they are
+        on the commit (unlike git-archive(1), which would leave out
+        export-ignore files and expand export-subst ones).
+
+        :param path: full path to an empty directory
+        """
+
+        with tempfile.TemporaryDirectory() as index_dir:
+            git_env = {
+                'GIT_INDEX_FILE': os.path.join(index_dir, 'index'),
+                'GIT_WORK_TREE': path,
+            }
+            self._git_repo.git.read_tree(self._git_commit, env=git_env)
+            self._git_repo.git.checkout_index('--all', env=git_env)
+
+    def _get_cache_trees_max_size(self):
+        """Get the maximum size (in bytes) of all trees"""
+
+        max_size = os.getenv(self.CACHE_TREES_MAX_SIZE_ENV)
+        if max_size is None:
+            return self.CACHE_TREES_MAX_SIZE
+        try:
+            return int(max_size) * 1024 * 1024
+        except ValueError:
+            log.msg_warn(
+                "{} must be a number of MiB, ignoring it"
+                .format(self.CACHE_TREES_MAX_SIZE_ENV)
+            )
+            return self.CACHE_TREES_MAX_SIZE
+
+    def _cache_collect_trees(self, *, keep_tree):
+        """
+        Wipe out least recently used trees until they fit in the budget
+
+        :param keep_tree: full path to a tree which must be kept no matter what
+        """
+
+        trees_path = os.path.join(self.CACHE_HOME, self.CACHE_TREES)
+        with util.file_lock("{}.lock".format(trees_path)):
+            trees = []
+            for entry in os.scandir(trees_path):
+                if entry.name.startswith('.') or not entry.is_dir() \
+                or entry.path == keep_tree:
+                    continue
+                trees.append(
+                    (entry.stat().st_mtime, _get_tree_size(entry.path), entry.path)
+                )
+
+            trees_size = _get_tree_size(keep_tree) + \
+                sum(tree_size for _, tree_size, _ in trees)
+            max_size = self._get_cache_trees_max_size()
+            keep_time = time() - self.CACHE_TREES_KEEP_TIME
+            for tree_mtime, tree_size, tree_path in sorted(trees):
+                if trees_size <= max_size or tree_mtime > keep_time:
+                    break
+                log.msg_debug("Wiping out tree {}", tree_path)
+                _remove_tree(tree_path)
+                trees_size -= tree_size
+
+            self._cache_collect_old_layout()
+
+    def _cache_collect_old_layout(self):
+        """
+        Wipe out kit caches from previous releases
+
+        Those were clones (along with their lock files) laid out
+        right under CACHE_HOME, which is now meant to hold repos and
+        trees only. They are never used again, so they'd stay forever.
+        """
+
+        keep_names = {
+            self.CACHE_REPOS, self.CACHE_TREES,
+            "{}.lock".format(self.CACHE_TREES),
+        }
+        for entry in os.scandir(self.CACHE_HOME):
+            if entry.name in keep_names:
+                continue
+            log.msg_debug("Wiping out old kit cache {}", entry.path)
+            if entry.is_dir(follow_symlinks=False):
+                _remove_tree(entry.path)
+            else:
+                os.unlink(entry.path)
+
+    @property
+    def commit(self):
+        """Commit this kit has been loaded from"""
+        return self._git_commit
+
+    @property
+    def tree(self):
+        """Hash of the git tree this kit has been loaded from"""
+        if self._git_tree is None:
+            self._git_tree = self._git_repo.git.rev_parse(
+                '{}^{{tree}}'.format(self._git_commit)
+            )
+        return self._git_tree
 
     def _cache_destroy_kit(self):
         """Destroy kit in cache"""
@@ -261,11 +630,46 @@ class GitRepoKit(Kit):
             shutil.rmtree(self._git_repo_path)
 
     def _get_kit_dir(self, kit_name):
-        return os.path.join(self.CACHE_HOME, kit_name)
+        return os.path.join(
+            self.CACHE_HOME, self.CACHE_REPOS, "{}.git".format(kit_name)
+        )
+
+    def _get_lock_file(self):
+        # Lock files live next to (not inside) kit caches
+        return "{}.lock".format(self._git_repo_path)
+
+
+def _set_read_only(path):
+    """Take write permissions away from a whole directory tree"""
+
+    for root, dirs, files in os.walk(path, topdown=False):
+        for name in files:
+            file_path = os.path.join(root, name)
+            if not os.path.islink(file_path):
+                os.chmod(file_path, os.stat(file_path).st_mode & ~0o222)
+        os.chmod(root, os.stat(root).st_mode & ~0o222)
+
+
+def _remove_tree(path):
+    """Remove a (read-only) directory tree"""
+
+    for root, dirs, files in os.walk(path):
+        os.chmod(root, os.stat(root).st_mode | 0o700)
+    shutil.rmtree(path)
+
+
+def _get_tree_size(path):
+    """Get the size (in bytes) of a directory tree"""
+
+    tree_size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            tree_size += os.lstat(os.path.join(root, name)).st_size
+    return tree_size
 
 
 @autolog
-def get_kit(kit_name, kit_version):
+def get_kit(kit_name, kit_version, pin=None):
     """Initialise kit provider"""
 
-    return GitRepoKit(kit_name, version=kit_version)
+    return GitRepoKit(kit_name, version=kit_version, pin=pin)
@@ -16,9 +16,15 @@ from . import Kit
 
 from ..util import autolog
 
+# Local kits can't be pinned on lockfiles
+PINNABLE = False
 
 @autolog
-def get_kit(kit_name, kit_version=None):
-    """Initialise kit provider"""
+def get_kit(kit_name, kit_version=None, pin=None):
+    """
+    Initialise kit provider
+
+    Local kits can't be pinned, so pin is ignored altogether
+    """
 
     return Kit(kit_name, root_dir=os.path.abspath(kit_name))
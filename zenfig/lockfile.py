@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+zenfig.lockfile
+~~~~~~~~
+
+Kit lockfiles
+
+A lockfile (zenfig.lock) records the commit (and its tree hash)
+each git kit was resolved to, so later runs can go straight to it.
+
+:copyright: (c) 2016 by Alejandro Ricoveri
+:license: MIT, see LICENSE for more details.
+
+"""
+
+import os
+import tempfile
+
+import yaml
+
+from . import log
+from . import util
+from .util import autolog
+
+# Default lockfile name, it lives in zenfig home directory
+LOCKFILE_NAME = "zenfig.lock"
+
+# Lockfile header
+LOCKFILE_HEADER = "# This file is generated by zenfig, do not edit it by hand\n"
+
+
+class LockfileException(BaseException):
+    """Basic lockfile exception"""
+    pass
+
+
+def get_default_path():
+    """Get the full path to the default lockfile"""
+
+    return os.path.join(util.get_data_home(), LOCKFILE_NAME)
+
+
+@autolog
+def load(path):
+    """
+    Load a lockfile
+
+    :param path: full path to the lockfile
+    :returns:
+        a dictionary whose keys are kit names and values are
+        their entries, empty if there's no lockfile at all
+    """
+
+    try:
+        with open(path, 'r') as f:
+            lock_data = util.yaml_load(f)
+    except FileNotFoundError:
+        return {}
+    except yaml.YAMLError as exc:
+        raise LockfileException("Invalid lockfile '{}': {}".format(path, exc))
+
+    if lock_data is None:
+        return {}
+    if not isinstance(lock_data, dict) or \
+    not isinstance(lock_data.get('kits', {}), dict):
+        raise LockfileException("Invalid lockfile '{}'".format(path))
+
+    entries = lock_data.get('kits', {})
+    for kit_name, entry in entries.items():
+        if not isinstance(entry, dict) or \
+        not {'commit', 'tree'}.issubset(entry):
+            raise LockfileException(
+                "Invalid entry for '{}' on lockfile '{}'".format(kit_name, path)
+            )
+    return entries
+
+
+def get_entry(kit):
+    """
+    Get the lockfile entry for a kit
+
+    :param kit: a Kit
+    :returns: a dictionary, None if the kit can't be pinned (e.g. local kits)
+    """
+
+    commit = getattr(kit, 'commit', None)
+    if commit is None:
+        return None
+    return {'commit': commit, 'tree': kit.tree}
+
+
+@autolog
+def save(path, entries):
+    """
+    Save a lockfile
+
+    The lockfile is written atomically, entries for kits
+    already in there (and not in entries) are kept.
+
+    :param path: full path to the lockfile
+    :param entries: a dictionary whose keys are kit names and values are entries
+    """
+
+    lock_entries = load(path)
+    lock_entries.update(entries)
+
+    log.msg("Writing lockfile '{}'".format(path))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(LOCKFILE_HEADER)
+            yaml.safe_dump({'kits': lock_entries}, f, default_flow_style=False)
+        os.replace(tmp_file, path)
+    except BaseException:
+        os.unlink(tmp_file)
+        raise
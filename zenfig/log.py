@@ -6,72 +6,161 @@ zenfig.log
 
 Nice output
 
+Messages are issued according to a log level: warnings and errors
+are always issued, regular messages only from LOG_LEVEL_INFO (-v)
+and debug messages only from LOG_LEVEL_DEBUG (-vv). Messages can
+be given as format strings along with their arguments, in which case
+they only get formatted if they are actually issued.
+
 :copyright: (c) 2016 by Alejandro Ricoveri
 :license: MIT, see LICENSE for more details.
 """
 
 
+import os
 import sys
+import atexit
 from clint.textui.colored import white, red, cyan, yellow, green
 from clint.textui import puts
 
+# Log levels
+LOG_LEVEL_WARN = 0
+LOG_LEVEL_INFO = 1
+LOG_LEVEL_DEBUG = 2
+
 # Globals
-_stdout = False
+_level = LOG_LEVEL_WARN
+_stream = None  # sys.stderr until init() says otherwise
+_colors = True
+_flush_always = False
+
+# Whether debug messages are issued (cheap enough to
+# be checked on every call of functions under autolog)
+debug_enabled = False
 
 
-def init(*, quiet_stdout=True):
+def init(*, level=LOG_LEVEL_WARN, log_file=None):
     """
     Initiate the log module
 
-    :param threshold_lvl: messages under this level won't be issued/logged
-    :param to_stdout: activate stdout log stream
+    Messages are written to a buffered stream (either stderr or
+    log_file), which is flushed on warnings, errors and at exit,
+    as well as whenever flush() is called. Terminals get to see
+    messages line by line, though.
+
+    :param level: messages above this level won't be issued/logged
+    :param log_file: path to a file messages are appended to instead of stderr
     """
 
-    # create stout handler
-    if not quiet_stdout:
-        global _stdout
-        _stdout = True
+    global _level, _stream, _colors, debug_enabled
+
+    _level = level
+    debug_enabled = level >= LOG_LEVEL_DEBUG
+
+    # stderr itself is left open
+    if _stream is not None:
+        _stream.close()
+        _stream = None
+
+    _colors = log_file is None
+    if log_file is not None:
+        _stream = open(log_file, 'a')
+    else:
+        try:
+            _stream = open(
+                sys.stderr.fileno(), 'w', closefd=False,
+                buffering=1 if sys.stderr.isatty() else -1
+            )
+        except (AttributeError, OSError, ValueError):
+            # stderr has been replaced by something
+            # without a file descriptor, it is used as it is
+            pass
+
+
+def is_enabled(level):
+    """Tell whether messages of a certain level are issued"""
+    return level <= _level
+
+
+def flush():
+    """Flush all messages issued so far"""
+    if _stream is not None:
+        _stream.flush()
+
+
+def _after_fork():
+    # Forked processes (e.g. ProcessPoolExecutor workers) don't get
+    # to run atexit handlers, so they don't keep anything on buffer
+    global _flush_always
+    _flush_always = True
+
+
+atexit.register(flush)
+os.register_at_fork(before=flush, after_in_child=_after_fork)
+
+
+def _write(message, *, colorf, bold, flush_now=False):
+    if _stream is None:
+        print(colorf(message, bold=bold), file=sys.stderr)
+        return
+
+    if _colors:
+        message = colorf(message, bold=bold)
+    _stream.write("{}\n".format(message))
+    if flush_now or _flush_always:
+        _stream.flush()
 
 
 def to_stdout(msg, *, colorf=green, bold=False, quiet=True):
-    if not quiet or _stdout:
-        print(colorf(msg, bold=bold), file=sys.stderr)
+    if not quiet or _level >= LOG_LEVEL_INFO:
+        _write(msg, colorf=colorf, bold=bold, flush_now=not quiet)
+
 
+def _format(message, args):
+    if args:
+        return message.format(*args)
+    return message
 
 
-def msg(message, *, bold=False):
+def msg(message, *args, bold=False):
     """
     Log a regular message
 
     :param message: the message to be logged
+    :param args: arguments message gets formatted with, if given
     """
-    to_stdout(" --- {message}".format(message=message), bold=bold)
+    if _level >= LOG_LEVEL_INFO:
+        _write(" --- {}".format(_format(message, args)), colorf=green, bold=bold)
 
 
-def msg_warn(message):
+def msg_warn(message, *args):
     """
     Log a warning message
 
     :param message: the message to be logged
+    :param args: arguments message gets formatted with, if given
     """
-    to_stdout(" (!) {message}".format(message=message),
-              colorf=yellow, bold=True, quiet=False)
+    _write(" (!) {}".format(_format(message, args)),
+           colorf=yellow, bold=True, flush_now=True)
 
 
-def msg_err(message):
+def msg_err(message, *args):
     """
     Log an error message
 
     :param message: the message to be logged
+    :param args: arguments message gets formatted with, if given
     """
-    to_stdout(" !!! {message}".format(message=message),
-            colorf=red, bold=True, quiet=False)
+    _write(" !!! {}".format(_format(message, args)),
+           colorf=red, bold=True, flush_now=True)
 
 
-def msg_debug(message):
+def msg_debug(message, *args):
     """
     Log a debug message
 
     :param message: the message to be logged
+    :param args: arguments message gets formatted with, if given
     """
-    to_stdout(" (*) {message}".format(message=message), colorf=cyan)
+    if _level >= LOG_LEVEL_DEBUG:
+        _write(" (*) {}".format(_format(message, args)), colorf=cyan, bold=False)
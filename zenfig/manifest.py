@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+"""
+zenfig.manifest
+~~~~~~~~
+
+Kit manifests
+
+:copyright: (c) 2016 by Alejandro Ricoveri
+:license: MIT, see LICENSE for more details.
+
+"""
+
+import os
+import hashlib
+
+import jinja2
+from jinja2 import meta
+
+from . import __version__ as pkg_version
+from . import log
+from . import cache
+from . import renderer
+from .util import autolog
+
+
+def _get_hash(value):
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+
+def _get_template_inputs(tpl_env, template_file):
+    """
+    Find out what a template depends on
+
+    The template and all templates it pulls in (includes, imports, etc.)
+    are parsed in order to find out which variables they reference.
+
+    :param tpl_env: jinja2 environment used to render the template
+    :param template_file: path to the template file
+    :returns:
+        a tuple with a set of variable names and a dictionary whose keys are
+        template names and values are both their file names and content hashes.
+        If there are templates whose names can only be known at render time,
+        (None, None) is returned.
+    """
+
+    var_names = set()
+    templates = {}
+
+    pending_templates = [template_file]
+    while pending_templates:
+        template_name = pending_templates.pop()
+        if template_name in templates:
+            continue
+
+        source, filename, _ = tpl_env.loader.get_source(tpl_env, template_name)
+        templates[template_name] = (filename, _get_hash(source))
+
+        tpl_ast = tpl_env.parse(source)
+        var_names.update(meta.find_undeclared_variables(tpl_ast))
+        for ref_name in meta.find_referenced_templates(tpl_ast):
+            # This one is dynamic
+            if ref_name is None:
+                return None, None
+            pending_templates.append(ref_name)
+
+    return var_names, templates
+
+
+class Manifest:
+    """
+    Kit manifest
+
+    A manifest records, for each template from a kit, the variables it
+    read, the templates it pulled in and the output it last produced.
+    This way, a template only needs to be rendered again whenever
+    one of these has changed.
+    """
+
+    def __init__(self, kit):
+        """
+        Constructor
+
+        :param kit: Kit this manifest belongs to
+        """
+
+        self._cache_slot = cache.get_digest(kit.name)
+        self._entries = cache.load(
+            cache.CACHE_MANIFESTS, self._cache_slot, pkg_version
+        )
+        if self._entries is None:
+            self._entries = {}
+
+    def is_outdated(self, template_data, vars):
+        """
+        Tell whether a template needs to be rendered again
+
+        :param template_data: template description, as found in a kit
+        :param vars: variables to be injected into the template
+        :returns: True if any of the template inputs or its output has changed
+        """
+
+        try:
+            entry = self._entries[template_data['path']]
+        except KeyError:
+            return True
+
+        # Templates pulling in other templates at render time
+        if entry['templates'] is None:
+            return True
+
+        # Output file has been either moved or modified
+        output_file = os.path.abspath(template_data['output_file'])
+        if entry['output_file'] != output_file:
+            return True
+        if renderer.get_output_hash(output_file) != entry['output_hash']:
+            return True
+
+        # Variable values
+        for var_name, var_digest in entry['vars'].items():
+            if cache.get_digest(vars.get(var_name)) != var_digest:
+                log.msg_debug("'{}' has changed", var_name)
+                return True
+
+        # Template files
+        tpl_env = renderer.create_template_env(template_data['include'])
+        for template_name, template_file in entry['templates'].items():
+            try:
+                source, filename, _ = tpl_env.loader.get_source(
+                    tpl_env, template_name
+                )
+            except jinja2.TemplateNotFound:
+                return True
+            if (filename, _get_hash(source)) != tuple(template_file):
+                log.msg_debug("'{}' has changed", filename)
+                return True
+
+        return False
+
+    @autolog
+    def update(self, template_data, vars, output_hash):
+        """
+        Record a rendered template
+
+        :param template_data: template description, as found in a kit
+        :param vars: variables injected into the template
+        :param output_hash: hash of the rendered template (see renderer._write_output)
+        """
+
+        tpl_env = renderer.create_template_env(template_data['include'])
+        var_names, templates = _get_template_inputs(
+            tpl_env, template_data['path']
+        )
+        if var_names is not None:
+            var_names = {
+                var_name: cache.get_digest(vars.get(var_name))
+                for var_name in var_names
+            }
+
+        self._entries[template_data['path']] = {
+            'output_file': os.path.abspath(template_data['output_file']),
+            'output_hash': output_hash,
+            'vars': var_names,
+            'templates': templates,
+        }
+
+    def save(self):
+        """Save this manifest for the next run"""
+
+        cache.store(
+            cache.CACHE_MANIFESTS, self._cache_slot, pkg_version, self._entries
+        )
@@ -13,13 +13,23 @@ Template renderer
 
 import os
 import re
+import sys
+import hashlib
+import tempfile
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
 import jinja2
 
 from . import log
 from . import api
 from . import util
+from . import cache
 
 from .util import autolog
+from .kits import archive
 from .depgraph.depgraph import DepGraph
 from .depgraph.node import Node
 
@@ -30,18 +40,244 @@ class InvalidTemplateDirError(BaseException):
     def __init__(self, directory):
         super().__init__("main.j2 not found in {}".format(directory))
 
-# Regular expression strings used
-# for variable isolation during resolution
-# by _var_resolve
-REGEX_PATT_JINJA2 = '{{.+}}'
-REGEX_JINJA2 = re.compile(REGEX_PATT_JINJA2)
-
-# Regular expressions for _var_strip
+# Regular expressions for variable references
 REGEX_PATT_VAR = '@[0-9A-Za-z-_]+'
 REGEX_FMT_VAR = '@{}'
-REGEX_FMT_VAR_STRIP = '[@]'
 REGEX_VAR = re.compile(REGEX_PATT_VAR)
-REGEX_VAR_STRIP = re.compile(REGEX_FMT_VAR_STRIP)
+
+# References to other variables are swapped by these
+# identifiers before lexing values through jinja2
+REGEX_FMT_REF_NAME = '_zfref{}_'
+REGEX_REF_NAME = re.compile('_zfref([0-9]+)_')
+
+# ... and their values are passed as these on rendering
+FMT_REF_VAR = '_zfvar{}_'
+
+# Values made of a single {{ expression }}
+REGEX_EXPR = re.compile(r'^{{-?(.*?)-?}}$', re.DOTALL)
+
+# Maximum number of compiled templates kept by a TemplateCache
+TPL_CACHE_MAXSIZE = 1024
+
+# Maximum number of values whose references are kept around
+VAR_REFS_CACHE_MAXSIZE = 4096
+
+# Environment used to lex variable values,
+# it shares its syntax with _create_var_env
+_var_lex_env = jinja2.Environment()
+
+
+@lru_cache(maxsize=VAR_REFS_CACHE_MAXSIZE)
+def _parse_var(value):
+    """
+    Parse a string variable value
+
+    References to other variables within a value are found through
+    the jinja2 lexer. Only references found within jinja2 expressions
+    and statements (e.g. {{ @foo }} or {% if @bar %}) count, anything
+    else (plain text, quoted strings) is left out.
+
+    :param value: string to be parsed
+    :returns:
+        a tuple with the value as a jinja2 template source, in which each
+        reference has been swapped by an identifier (see FMT_REF_VAR) holding
+        the position of its name, names of referenced variables (without
+        duplicates) and, if the whole value is a single {{ expression }},
+        the expression itself (None otherwise)
+    """
+
+    # Nothing to be done in here
+    if '@' not in value and '{' not in value:
+        return value, (), None
+
+    # '@' is not valid jinja2 syntax, so references are
+    # swapped by identifiers the lexer is able to deal with
+    ref_names = []
+
+    def _ref_repl(match):
+        ref_names.append(match.group(0)[1:])
+        return REGEX_FMT_REF_NAME.format(len(ref_names) - 1)
+
+    source = REGEX_VAR.sub(_ref_repl, value)
+
+    # Each value is lexed once
+    refs = OrderedDict()
+    ref_vars = {}
+    expr_blocks = 0
+    in_expr = False
+    is_expr = True
+    for _, token_type, token_value in _var_lex_env.lex(source):
+        if token_type == 'variable_begin':
+            expr_blocks += 1
+            in_expr = True
+        elif token_type == 'variable_end':
+            in_expr = False
+        elif not in_expr:
+            # Anything but a single expression (data, blocks,
+            # comments, ...) takes the template path
+            is_expr = False
+        if token_type == 'name':
+            match = REGEX_REF_NAME.fullmatch(token_value)
+            if match:
+                ref_index = int(match.group(1))
+                ref_name = ref_names[ref_index]
+                refs.setdefault(ref_name, len(refs))
+                ref_vars[ref_index] = FMT_REF_VAR.format(refs[ref_name])
+
+    # Those not being actual references are put back
+    def _ref_restore(match):
+        ref_index = int(match.group(1))
+        try:
+            return ref_vars[ref_index]
+        except KeyError:
+            return REGEX_FMT_VAR.format(ref_names[ref_index])
+
+    if ref_names:
+        source = REGEX_REF_NAME.sub(_ref_restore, source)
+
+    expr = None
+    if is_expr and expr_blocks == 1:
+        match = REGEX_EXPR.match(source)
+        if match:
+            expr = match.group(1)
+
+    return source, tuple(refs), expr
+
+
+def _get_var_refs(value):
+    """
+    Find references to other variables within a string
+
+    :param value: string to be looked up for references
+    :returns: a tuple with names of referenced variables, without duplicates
+    """
+
+    return _parse_var(value)[1]
+
+
+class TemplateCache:
+    """
+    LRU cache of compiled jinja2 templates
+
+    Templates are compiled from strings through a single
+    environment and kept around (keyed by their source), so
+    repeated expressions only get compiled once.
+    """
+
+    def __init__(self, tpl_env, *, maxsize=TPL_CACHE_MAXSIZE):
+        """
+        Constructor
+
+        :param tpl_env: jinja2 environment used to compile templates
+        :param maxsize: maximum number of compiled templates to be kept
+        """
+
+        self._tpl_env = tpl_env
+        self._maxsize = maxsize
+        self._templates = OrderedDict()
+
+        # This cache can be shared by several threads
+        self._lock = threading.Lock()
+
+        # Cache statistics
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    def get_template(self, source):
+        """
+        Get a compiled template from its source
+
+        :param source: template source string
+        :returns: a jinja2.Template
+        """
+
+        return self._get(('template', source), self._tpl_env.from_string)
+
+    def get_expression(self, source):
+        """
+        Get a compiled expression from its source
+
+        :param source: expression source string (e.g. "foo|upper")
+        :returns:
+            a callable taking variables as keyword arguments
+            and returning the expression result as it is
+            (jinja2.Undefined included, see VarNode._render)
+        """
+
+        return self._get(
+            ('expression', source),
+            lambda expr: self._tpl_env.compile_expression(
+                expr, undefined_to_none=False
+            )
+        )
+
+    def _get(self, key, compile_func):
+        with self._lock:
+            try:
+                tpl = self._templates[key]
+                self._templates.move_to_end(key)
+                self._hits += 1
+            except KeyError:
+                self._misses += 1
+                tpl = compile_func(key[1])
+                self._templates[key] = tpl
+
+                # Least recently used template goes away
+                if len(self._templates) > self._maxsize:
+                    self._templates.popitem(last=False)
+        return tpl
+
+
+class TemplateBytecodeCache(jinja2.FileSystemBytecodeCache):
+    """
+    On-disk cache of compiled template files
+
+    Entries are keyed by template path and modification time,
+    jinja2 itself discards them whenever the checksum of the
+    template source does not match the one they were compiled from.
+    """
+
+    def get_cache_key(self, name, filename=None):
+        """
+        Get the cache key of a template
+
+        :param name: template name
+        :param filename: full path to the template file
+        :returns: a string identifying the template
+        """
+
+        cache_key = name
+        if filename is not None:
+            try:
+                mtime = os.path.getmtime(filename)
+            except OSError:
+                mtime = None
+            cache_key = "{}|{}|{}".format(name, filename, mtime)
+        return hashlib.sha1(cache_key.encode('utf-8')).hexdigest()
+
+
+# Bytecode cache shared by all template environments
+_bytecode_cache = None
+
+
+def _get_bytecode_cache():
+    """Get the bytecode cache used by all template environments"""
+
+    global _bytecode_cache
+
+    # Cache directory could have been either moved or purged
+    cache_dir = cache.get_cache_dir(cache.CACHE_BYTECODE)
+    if _bytecode_cache is None or _bytecode_cache.directory != cache_dir:
+        _bytecode_cache = TemplateBytecodeCache(cache_dir)
+    return _bytecode_cache
 
 
 class VarNode(Node):
@@ -70,10 +306,7 @@ class VarNode(Node):
             # References to @variables within {{ jinja blocks }} are
             # considered by this node as references to dependencies.
             # They are isolated and collected.
-            for jinja_blk in REGEX_JINJA2.findall(value):
-                for var_name in REGEX_VAR.findall(value):
-                    dep_name = REGEX_VAR_STRIP.sub('', var_name)
-                    deps.append(dep_name)
+            deps.extend(_get_var_refs(value))
 
         # dict found?, its values are checked as well for any dependencies
         elif isinstance(value, dict):
@@ -89,79 +322,138 @@ class VarNode(Node):
         # All scavenged dependencies are returned
         return deps
 
-    @staticmethod
-    def _render(value, deps):
+    def _get_tpl_cache(self):
+        """Get the compiled templates cache used by this node"""
+
+        # Nodes evaluated by other processes are
+        # detached from their graph
+        if self._depgraph is None:
+            return _get_process_tpl_cache()
+        return self._depgraph.tpl_cache
+
+    def _render(self, value):
         """
         Render a string through jinja2
 
+        Strings made of a single {{ expression }} are evaluated rather
+        than rendered, so their results keep their own types
+        (e.g. "{{ @font_size }}" gives back an int if font_size is one).
+
         :param value: value to be rendered
-        :param deps: a list of variables to be applied upon rendering
-        :returns: A jinja2-rendered string
+        :returns: A jinja2-rendered string, or the expression result
         """
-        tpl = {'@': value}
 
-        tpl_vars = {}
-        for dep_name, dep_node in deps.items():
-            tpl_vars[dep_name] = dep_node.value
-        # so we can render this value
-        # Load template environment
-        tpl_env = jinja2.Environment(loader=jinja2.DictLoader(tpl))
-
-        # Register all globals and filters
-        _register_api(tpl_env)
+        # References within this value are swapped by identifiers
+        # whose values are taken straight from this node's dependencies
+        source, refs, expr = _parse_var(value)
+        tpl_vars = {
+            FMT_REF_VAR.format(ref_index): self.deps[ref_name].value
+            for ref_index, ref_name in enumerate(refs)
+        }
+
+        # Templates are compiled once and shared by
+        # all nodes within the same graph (or process)
+        tpl_cache = self._get_tpl_cache()
+        if expr is not None:
+            result = tpl_cache.get_expression(expr)(**tpl_vars)
+
+            # Undefined stuff (e.g. "{{ @a if @off }}") renders as
+            # an empty string, just like it would within a template
+            if isinstance(result, jinja2.Undefined):
+                return ''
+            return result
 
         # Render and deliver, finally!
-        return tpl_env.get_template('@').render(tpl_vars)
+        return tpl_cache.get_template(source).render(tpl_vars)
 
-    def on_evaluate(self, value=None):
+    def on_evaluate(self):
         """Evaluate this node"""
 
-        # Bootstrap this thing with its first value
-        if value is None:
-            return self.on_evaluate(self.value)
-
         # no point if there are no dependencies whatsoever.
         if not len(self.deps):
             return self.value
 
-        # Each string found will be treated with already evaluated
-        # dependencies values
-        if isinstance(value, str):
-
-            # Each dependency replaces its references within this node's value
-            for dep_name, dep_node in self.deps.items():
+        return self._evaluate(self.value)
 
-                # Actual value substitution
-                # on node's.value (which is the resulting
-                # value from resolution)
-                if isinstance(dep_node.value, str):
-                    var_fmt = '"{}"'
-                else:
-                    var_fmt = '{}'
+    def _evaluate(self, value):
+        """
+        Evaluate a value (and its elements) from this node
 
-                var_pattern = REGEX_FMT_VAR.format(dep_name)
-                var_repl = var_fmt.format(dep_node.value)
-                value = re.sub(var_pattern, var_repl, value)
+        :param value: value to be evaluated
+        :returns: the evaluated value
+        """
 
-            # Once all dependencies have been put in place
-            # time to render
-            return self._render(value, self.deps)
+        # Each string found will be rendered with
+        # already evaluated dependencies values
+        if isinstance(value, str):
+            return self._render(value)
 
         # Check for each element in this dict and evaluate it accordingly
         elif isinstance(value, dict):
             for dkey, dval in value.items():
-                value[dkey] = self.on_evaluate(dval)
+                value[dkey] = self._evaluate(dval)
 
         # Check for each element in the list and evaluate it accordingly
         elif isinstance(value, list):
             for i, lval in enumerate(value):
-                value[i] = self.on_evaluate(lval)
+                value[i] = self._evaluate(lval)
 
         # At this point, whichever value it was being evaluated, it
         # got evaluated, so ...
         return value
 
 
+class VarDepGraph(DepGraph):
+    """
+    Variables dependency graph
+
+    All of its nodes are VarNodes sharing the same jinja2
+    environment and compiled templates.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Constructor
+
+        :param kwargs: variables to be resolved
+        """
+
+        # This is created once per graph, rather than once per node
+        self._tpl_cache = TemplateCache(_create_var_env())
+
+        super().__init__(node_class=VarNode, **kwargs)
+
+    @property
+    def tpl_cache(self):
+        """Compiled templates shared by all nodes"""
+        return self._tpl_cache
+
+
+# Compiled templates cache used by detached nodes
+_process_tpl_cache = None
+
+
+def _get_process_tpl_cache():
+    """Get the compiled templates cache for this process"""
+
+    global _process_tpl_cache
+    if _process_tpl_cache is None:
+        _process_tpl_cache = TemplateCache(_create_var_env())
+    return _process_tpl_cache
+
+
+def _create_var_env():
+    """
+    Create a jinja2 environment for variable resolution
+
+    :returns: a jinja2.Environment with all API functions registered
+    """
+
+    tpl_env = jinja2.Environment()
+    _register_api(tpl_env)
+    return tpl_env
+
+
 @autolog
 def render_dict(**kwargs):
     """
@@ -171,6 +463,21 @@ def render_dict(**kwargs):
     :returns: A dictionary whose string values have been rendered with jinja2
     """
 
+    return render_vars(kwargs)
+
+
+@autolog
+def render_vars(vars, *, executor=None):
+    """
+    Render a jinja2-flavored dictionary with itself
+
+    :param vars: A dictionary containing expected-to-be jinja2 strings
+    :param executor:
+        A concurrent.futures.Executor on which independent
+        variables are resolved concurrently
+    :returns: A dictionary whose string values have been rendered with jinja2
+    """
+
     #############################################
     # Strings found in this dict will be rendered
     # using this same dict as its variables
@@ -179,7 +486,14 @@ def render_dict(**kwargs):
     # reference other variables
     #############################################
 
-    return DepGraph(node_class=VarNode, **kwargs).evaluate()
+    graph = VarDepGraph(**vars)
+    resolved = graph.evaluate(executor=executor)
+
+    log.msg_debug(
+        "Variable templates cache: {} hit(s), {} miss(es)",
+        graph.tpl_cache.hits, graph.tpl_cache.misses
+    )
+    return resolved
 
 
 def _register_api(tpl_env):
@@ -205,16 +519,42 @@ def _register_api_filters(tpl_env):
         tpl_env.filters[api_filter_name] = api_filter_func
 
 
-@autolog
-def render_file(*, vars, template_file, output_file, template_include_dirs):
+# Template environments, by template search path
+_template_envs = {}
+
+
+def get_template_loader(template_include_dirs):
     """
-    Render a jinja2 template
+    Get a jinja2 loader for a template search path
+
+    Directories within archive kits are read straight from the
+    archive, while everything else is read from the file system.
 
-    :param vars:
-        a dictionary containing all variables to be injected into the template
-    :param template_file: path to the template file
-    :param output_file: path to resulting output file
     :param template_include_dirs: template include directories
+    :returns: a jinja2 loader
+    """
+
+    if not any(archive.split_path(search_path) for search_path in template_include_dirs):
+        return jinja2.FileSystemLoader(template_include_dirs)
+
+    return jinja2.ChoiceLoader([
+        archive.ArchiveLoader(search_path)
+        if archive.split_path(search_path) is not None
+        else jinja2.FileSystemLoader(search_path)
+        for search_path in template_include_dirs
+    ])
+
+
+def create_template_env(template_include_dirs):
+    """
+    Create a jinja2 environment for template files
+
+    Environments are created once per template search path and
+    kept around, templates loaded by them are reloaded whenever
+    they change on disk.
+
+    :param template_include_dirs: template include directories
+    :returns: a jinja2.Environment with all API functions registered
     """
 
     ####################################################
@@ -236,6 +576,14 @@ def render_file(*, vars, template_file, output_file, template_include_dirs):
         os.path.join(util.get_data_home(), 'templates')
     )
 
+    bytecode_cache = _get_bytecode_cache()
+    try:
+        tpl_env = _template_envs[tuple(template_include_dirs)]
+        if tpl_env.bytecode_cache is bytecode_cache:
+            return tpl_env
+    except KeyError:
+        pass
+
     log.msg_debug("Template search path:")
     log.msg_debug("*********************")
     for search_path in template_include_dirs:
@@ -246,7 +594,12 @@ def render_file(*, vars, template_file, output_file, template_include_dirs):
     # load template environment
     ###########################
     tpl_env = jinja2.Environment(
-        loader=jinja2.FileSystemLoader(template_include_dirs),
+        loader=get_template_loader(template_include_dirs),
+
+        # Compiled templates (from both the kit and the user's
+        # templates directory) are kept on disk across runs
+        bytecode_cache=bytecode_cache,
+
         trim_blocks=True,
         keep_trailing_newline=True,
         line_comment_prefix="#",
@@ -265,19 +618,302 @@ def render_file(*, vars, template_file, output_file, template_include_dirs):
     ############################
     _register_api(tpl_env)
 
+    _template_envs[tuple(template_include_dirs)] = tpl_env
+    return tpl_env
+
+
+@autolog
+def render_template(*, vars, template_file, template_include_dirs):
+    """
+    Render a jinja2 template into a string
+
+    :param vars:
+        a dictionary containing all variables to be injected into the template
+    :param template_file: path to the template file
+    :param template_include_dirs: template include directories
+    :returns: the rendered template
+    """
+
+    return ''.join(_generate_template(
+        vars=vars,
+        template_file=template_file,
+        template_include_dirs=template_include_dirs,
+    ))
+
+
+def _generate_template(*, vars, template_file, template_include_dirs):
+    """
+    Render a jinja2 template bit by bit
+
+    :param vars:
+        a dictionary containing all variables to be injected into the template
+    :param template_file: path to the template file
+    :param template_include_dirs: template include directories
+    :returns: a generator of rendered string chunks
+    """
+
     # load the template
+    tpl_env = create_template_env(template_include_dirs)
     tpl = tpl_env.get_template(template_file)
 
-    ##############################################
-    # Render template to destination (output) file
-    ##############################################
     log.msg("Rendering template ...")
-    rendered_str = tpl.render(**vars)
+    return tpl.generate(**vars)
+
+
+# Size of chunks read from existing output files
+OUTPUT_CHUNK_SIZE = 64 * 1024
+
+# Encoding output files are written with
+OUTPUT_ENCODING = 'utf-8'
+
+
+def get_output_hash(path):
+    """
+    Get the hash of an output file, the same way _write_output does
+
+    :param path: full path to the file
+    :returns: an hexadecimal digest string, None if it can't be read
+    """
+
+    # Files are hashed byte by byte, exactly as they are on disk
+    file_hash = hashlib.sha1()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(OUTPUT_CHUNK_SIZE), b''):
+                file_hash.update(chunk)
+    except OSError:
+        return None
+    return file_hash.hexdigest()
+
+
+def _copy_file_attrs(fd, path):
+    """
+    Give a new output file the owner and mode of the one it replaces
+
+    New output files get the mode they would get if they
+    were created through open(), and the owner of this process.
+
+    :param fd: file descriptor of the new output file
+    :param path: full path to the output file
+    """
+
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        # Just as if the file was created through open()
+        umask = os.umask(0)
+        os.umask(umask)
+        os.fchmod(fd, 0o666 & ~umask)
+        return
+
+    # Only privileged users can give files away,
+    # in which case the file ends up owned by this process
+    try:
+        os.fchown(fd, file_stat.st_uid, file_stat.st_gid)
+    except PermissionError:
+        pass
+
+    # Changing owners can clear setuid/setgid bits,
+    # so the mode is set afterwards
+    os.fchmod(fd, file_stat.st_mode & 0o7777)
+
+
+def _write_output(rendered, output_file):
+    """
+    Write a rendered template to its destination
+
+    Rendered chunks are streamed into a temporary file on the same
+    directory which then atomically replaces the output file, so
+    readers never get to see a half-written one. Output files are
+    left untouched if their contents are the same as the rendered template.
+
+    :param rendered: rendered template, either as a string or as string chunks
+    :param output_file: path to resulting output file, None means stdout
+    :returns: hash of the rendered template
+    """
+
+    if isinstance(rendered, str):
+        rendered = (rendered,)
+    output_hash = hashlib.sha1()
+
     if output_file is None:
         # Render to stdout
-        print(rendered_str)
-    else:
-        output_file = os.path.abspath(output_file)
+        for chunk in rendered:
+            output_hash.update(chunk.encode(OUTPUT_ENCODING))
+            sys.stdout.write(chunk)
+        sys.stdout.write('\n')
+        sys.stdout.flush()
+        return output_hash.hexdigest()
+
+    # Output files could be symlinks (e.g. dotfiles repositories),
+    # those are followed rather than replaced
+    output_file = os.path.realpath(output_file)
+    fd, tmp_file = tempfile.mkstemp(
+        dir=os.path.dirname(output_file),
+        prefix='.{}.'.format(os.path.basename(output_file))
+    )
+    try:
+        # What gets hashed is exactly what gets written
+        with os.fdopen(fd, 'wb') as ofile:
+            for chunk in rendered:
+                chunk = chunk.encode(OUTPUT_ENCODING)
+                output_hash.update(chunk)
+                ofile.write(chunk)
+            ofile.flush()
+
+            if get_output_hash(output_file) == output_hash.hexdigest():
+                log.msg("'{}' is up to date".format(output_file))
+                os.unlink(tmp_file)
+                return output_hash.hexdigest()
+
+            _copy_file_attrs(ofile.fileno(), output_file)
+            os.fsync(ofile.fileno())
         log.msg("Writing to '{}'".format(output_file), bold=True)
-        with open(output_file, 'w') as ofile:
-            ofile.write(rendered_str)
+        os.replace(tmp_file, output_file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.unlink(tmp_file)
+        raise
+    return output_hash.hexdigest()
+
+
+@autolog
+def render_file(*, vars, template_file, output_file, template_include_dirs):
+    """
+    Render a jinja2 template
+
+    :param vars:
+        a dictionary containing all variables to be injected into the template
+    :param template_file: path to the template file
+    :param output_file: path to resulting output file
+    :param template_include_dirs: template include directories
+    """
+
+    ##############################################
+    # Render template to destination (output) file
+    ##############################################
+    _write_output(
+        _generate_template(
+            vars=vars,
+            template_file=template_file,
+            template_include_dirs=template_include_dirs,
+        ),
+        output_file
+    )
+
+
+# Variables used by worker processes (see render_files)
+_worker_vars = None
+
+
+def _init_worker(vars):
+    """Worker process initialisation: variables are received only once"""
+
+    global _worker_vars
+    _worker_vars = vars
+
+
+def _render_template_worker(template_file, template_include_dirs):
+    """Render a template inside a worker process"""
+
+    return render_template(
+        vars=_worker_vars,
+        template_file=template_file,
+        template_include_dirs=template_include_dirs,
+    )
+
+
+@autolog
+def render_files(*, vars, templates, preview=False, jobs=1, manifest=None):
+    """
+    Render a bunch of jinja2 templates
+
+    Templates can be rendered in parallel on a pool of processes,
+    either way, their outputs are written (or displayed) one by one
+    in the very same order templates were given.
+
+    :param vars:
+        a dictionary containing all variables to be injected into the templates
+    :param templates: a list of template descriptions, as found in a kit
+    :param preview: If True, templates are rendered to stdout
+    :param jobs: Number of templates to be rendered at once
+    :param manifest:
+        Kit manifest, if given, templates are only rendered if any of their
+        inputs has changed since the last time they were rendered
+    """
+
+    if manifest is not None and not preview:
+        outdated_templates = []
+        for template_data in templates:
+            if manifest.is_outdated(template_data, vars):
+                outdated_templates.append(template_data)
+            else:
+                log.msg("'{}' is up to date".format(template_data['output_file']))
+        templates = outdated_templates
+    else:
+        manifest = None
+
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=(vars,)) as executor:
+            rendered = [
+                executor.submit(
+                    _render_template_worker,
+                    template_data['path'], template_data['include']
+                )
+                for template_data in templates
+            ]
+            _write_outputs(
+                vars, templates, (future.result() for future in rendered),
+                preview, manifest
+            )
+    else:
+        # Templates are streamed straight to their outputs
+        _write_outputs(
+            vars, templates,
+            (
+                _generate_template(
+                    vars=vars,
+                    template_file=template_data['path'],
+                    template_include_dirs=template_data['include'],
+                )
+                for template_data in templates
+            ),
+            preview, manifest
+        )
+
+
+def _write_outputs(vars, templates, rendered, preview, manifest):
+    """
+    Write rendered templates, one by one
+
+    :param vars: variables injected into the templates
+    :param templates: a list of template descriptions, as found in a kit
+    :param rendered:
+        rendered templates (either strings or string chunks),
+        in the same order as templates
+    :param preview: If True, templates are rendered to stdout
+    :param manifest: Kit manifest on which rendered templates are recorded
+    """
+
+    for template_data, rendered_tpl in zip(templates, rendered):
+
+        # Depending on preview, the file would be either
+        # displayed on screen or written onto a file
+        if not preview:
+            output_file = template_data['output_file']
+        else:
+            log.msg_warn('Previewing file: {}'.format(
+                template_data['output_file']
+            ))
+            log.msg_warn('---')
+            output_file = None
+
+        output_hash = _write_output(rendered_tpl, output_file)
+
+        # Mark the end of previewed file
+        if preview:
+            log.msg_warn('---')
+
+        if manifest is not None:
+            manifest.update(template_data, vars, output_hash)
@@ -11,13 +11,29 @@ Utilities
 
 """
 import os
+import fcntl
 from functools import wraps
+from contextlib import contextmanager
 from time import time
 
 from . import log
 from . import __name__ as pkg_name
 
 
+def yaml_load(stream):
+    """
+    Load a YAML document
+
+    :param stream: either a string, bytes or a file object
+    :returns: the document as python objects
+    """
+
+    import yaml
+
+    # The C-accelerated (libyaml) loader is used whenever it is available
+    return yaml.load(stream, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+
 def memoize(func):
     """
     A simple memoizer decorator
@@ -42,20 +58,25 @@ def memoize(func):
 def autolog(func):
     """
     Decorator for automatically log the current function details.
+
+    Whether debug messages are enabled is checked on every call,
+    so functions decorated before log.init() get logged as well.
     """
 
     # Wrapper function
     @wraps(func)
     def _log_wrapper(*args, **kwargs):
+        # Nothing else to do unless debugging
+        if not log.debug_enabled:
+            return func(*args, **kwargs)
+
         # measure its execution time
         start_time = time()
         res = func(*args, **kwargs)
         end_time = time()
 
         # Dump the message + the name of this function to the log.
-        log.msg_debug("{} (t = {:.3f} ms)".format(
-           func.__name__, (end_time - start_time)*1000)
-        )
+        log.msg_debug("{} (t = {:.3f} ms)", func.__name__, (end_time - start_time)*1000)
 
         # return whatever func has thrown
         return res
@@ -70,8 +91,8 @@ def get_xdg_cache_home():
     # the template search path
     xdg_cache_home = os.getenv('XDG_CACHE_HOME')
     if xdg_cache_home is None:
-        xdg_cache_home = "{}/.cache/{}".format(os.getenv("HOME"), pkg_name)
-    return xdg_cache_home
+        xdg_cache_home = "{}/.cache".format(os.getenv("HOME"))
+    return "{}/{}".format(xdg_cache_home, pkg_name)
 
 
 @autolog
@@ -79,3 +100,27 @@ def get_data_home():
     """ Get zenfig home directory for user"""
 
     return "{}/.{}".format(os.getenv("HOME"), pkg_name)
+
+
+@contextmanager
+def file_lock(lock_file):
+    """
+    Hold an exclusive lock on a file
+
+    Other processes (or threads) trying to take the
+    same lock wait until it has been released.
+
+    :param lock_file: full path to the lock file, created if needed
+    """
+
+    os.makedirs(os.path.dirname(lock_file), exist_ok=True)
+    with open(lock_file, 'a') as f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            log.msg_debug("Waiting for lock on '{}' ...", lock_file)
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
@@ -13,21 +13,30 @@ Variables processor
 
 import os
 import re
+import hashlib
 import platform
+from time import time
+from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
 import yaml
-import psutil
-import cpuinfo
+import jinja2
 
 from . import __name__ as pkg_name
 from . import __version__ as pkg_version
 from . import log
 from . import util
+from . import cache
 from . import renderer
 from .kit import get_kit
 from .kits import Kit
+from .kits import archive
 from .util import autolog
 
 
+# Maximum number of variable files loaded at once
+VAR_FILES_MAX_WORKERS = 8
+
 # Sanity check regex for ZF_VAR_PATH
 ZF_VAR_PATH_REGEX = "([^:]+:)*[^:]+$"
 
@@ -101,6 +110,24 @@ def _resolve_search_path(*, user_var_files, kit_var_dir=None, defaults_only=Fals
     return sorted(set(user_var_files), key=lambda x: user_var_files.index(x))[::-1]
 
 
+def get_search_path(*, user_var_files=None, kit=None, defaults_only=False):
+    """
+    Get variable search path
+
+    :param user_var_files: Variable search paths set by the user
+    :param kit: Kit to be sourced
+    :param defaults_only: If True, variable locations set by the user won't be included.
+    :returns:
+        A list of variable locations/files, ordered by precedence
+    """
+
+    return _resolve_search_path(
+        user_var_files=list(user_var_files or []),
+        kit_var_dir=kit.var_dir if kit is not None else None,
+        defaults_only=defaults_only
+    )
+
+
 @autolog
 def _get_default_vars():
     """
@@ -226,22 +253,10 @@ def _create_fact(facts, key, value, *, prefix=None):
     facts["{}_{}".format(prefix, key)] = value
 
 
-@autolog
-def _get_facts(*, kit=None):
-    """
-    Get facts
+def _get_facts_general():
+    """General facts that are available for every platform"""
 
-    Facts are immutable global variables
-    set at the very end of variable resolution.
-
-    :param kit: A kit from which facts are going to be extracted
-    :return: A dictionary with a bunch of scavenged variables
-    """
-
-    # these are the facts
     facts = {}
-
-    # General facts that are available for every platform
     _create_fact(facts, 'version', pkg_version)
     _create_fact(facts, 'install_prefix', os.getenv('HOME'))
 
@@ -257,15 +272,13 @@ def _get_facts(*, kit=None):
     if os.name == 'posix':
         _create_fact(facts, 'sys_user', os.getenv('USER'))
         _create_fact(facts, 'sys_user_home', os.getenv('HOME'))
+    return facts
 
-    ####################################################
-    # System-related facts:
-    # ---------------------
-    # These facts collect characteristics of the current
-    # platform zenfig is running on
-    ####################################################
 
-    # Operating System facts
+def _get_facts_system():
+    """Operating System facts"""
+
+    facts = {}
     _system = platform.system()
     _create_fact(facts, 'system', _system)
     _create_fact(facts, 'sys_node', platform.node())
@@ -286,8 +299,15 @@ def _get_facts(*, kit=None):
 
     # Hardware-related facts
     _create_fact(facts, 'sys_machine', platform.machine())
+    return facts
+
+
+def _get_facts_cpu():
+    """Low level CPU information (thanks to cpuinfo)"""
 
-    # Low level CPU information (thanks to cpuinfo)
+    import cpuinfo
+
+    facts = {}
     _cpu_info = cpuinfo.get_cpu_info()
     _create_fact(facts, 'cpu_vendor_id', _cpu_info['vendor_id'])
     _create_fact(facts, 'cpu_brand', _cpu_info['brand'])
@@ -295,19 +315,144 @@ def _get_facts(*, kit=None):
     _create_fact(facts, 'cpu_hz', _cpu_info['hz_advertised_raw'][0])
     _create_fact(facts, 'cpu_arch', _cpu_info['arch'])
     _create_fact(facts, 'cpu_bits', _cpu_info['bits'])
+    return facts
+
+
+def _get_facts_mem():
+    """RAM information"""
 
-    # RAM information
+    import psutil
+
+    facts = {}
     _create_fact(facts, 'mem_total', psutil.virtual_memory()[0])
+    return facts
 
-    ####################
-    # Python information
-    ####################
+
+def _get_facts_python():
+    """Python information"""
+
+    facts = {}
     _py_ver = platform.python_version_tuple()
     _create_fact(facts, 'python_implementation', platform.python_revision())
     _create_fact(facts, 'python_version', platform.python_version())
     _create_fact(facts, 'python_version_major', _py_ver[0])
     _create_fact(facts, 'python_version_minor', _py_ver[1])
     _create_fact(facts, 'python_version_patch', _py_ver[2])
+    return facts
+
+
+# Time (in seconds) facts are kept on cache
+FACTS_TTL_NONE = 0  # they are always gathered
+FACTS_TTL_DAY = 86400
+FACTS_TTL_WEEK = 7 * FACTS_TTL_DAY
+
+##################################################
+# Fact providers:
+# ---------------
+# Each one of them gathers a category of facts
+# (listed along with it), which are kept on cache
+# for as long as their TTL says, facts that are likely
+# to change from one run to another (e.g. the environment)
+# are never cached.
+##################################################
+FACT_PROVIDERS = [
+    ('general', _get_facts_general, FACTS_TTL_NONE, [
+        'version', 'install_prefix', 'sys_uid', 'sys_gid',
+        'env', 'sys_path', 'sys_user', 'sys_user_home',
+    ]),
+    ('python', _get_facts_python, FACTS_TTL_NONE, [
+        'python_implementation', 'python_version', 'python_version_major',
+        'python_version_minor', 'python_version_patch',
+    ]),
+    ('system', _get_facts_system, FACTS_TTL_DAY, [
+        'system', 'sys_node', 'sys_machine', 'linux_dist_name',
+        'linux_dist_version', 'linux_dist_id', 'linux_release', 'osx_ver',
+    ]),
+    ('cpu', _get_facts_cpu, FACTS_TTL_WEEK, [
+        'cpu_vendor_id', 'cpu_brand', 'cpu_cores',
+        'cpu_hz', 'cpu_arch', 'cpu_bits',
+    ]),
+    ('mem', _get_facts_mem, FACTS_TTL_WEEK, [
+        'mem_total',
+    ]),
+]
+
+# Regular expression for catching references to facts
+REGEX_FACT = re.compile("{}_[0-9A-Za-z_]+".format(pkg_name))
+
+
+@autolog
+def _get_facts(*, kit=None, refresh=False, names=None):
+    """
+    Get facts
+
+    Facts are immutable global variables
+    set at the very end of variable resolution.
+
+    :param kit: A kit from which facts are going to be extracted
+    :param refresh: If True, cached facts are discarded and gathered again
+    :param names:
+        Names of the facts that are actually needed, only the providers of
+        these get to run. If None, every single fact is gathered.
+    :return: A dictionary with a bunch of scavenged variables
+    """
+
+    # these are the facts
+    facts = {}
+
+    ####################################################
+    # System-related facts:
+    # ---------------------
+    # These facts collect characteristics of the current
+    # platform zenfig is running on. Cached facts are
+    # specific to each host, since the cache itself
+    # could be shared (e.g. NFS home directories).
+    ####################################################
+    cache_slot = "facts_{}".format(cache.get_digest(platform.node()))
+    cached_facts = cache.load(cache.CACHE_FACTS, cache_slot, pkg_version)
+    if cached_facts is None or refresh:
+        cached_facts = {}
+    cache_outdated = False
+
+    now = time()
+    for provider_name, provider, provider_ttl, provider_facts in FACT_PROVIDERS:
+
+        # Don't even bother with facts nobody is going to use
+        if names is not None and not any(
+            "{}_{}".format(pkg_name, fact) in names for fact in provider_facts
+        ):
+            log.msg_debug("Skipping unreferenced facts: {}", provider_name)
+            continue
+
+        try:
+            cached_time, provider_facts = cached_facts[provider_name]
+            if now - cached_time > provider_ttl:
+                raise KeyError(provider_name)
+        except KeyError:
+            provider_facts = provider()
+            if provider_ttl != FACTS_TTL_NONE:
+                cached_facts[provider_name] = (now, provider_facts)
+                cache_outdated = True
+        facts.update(provider_facts)
+
+    if cache_outdated:
+        cache.store(cache.CACHE_FACTS, cache_slot, pkg_version, cached_facts)
+
+    facts.update(_get_kit_facts(kit))
+
+    # Give those variables already!
+    return facts
+
+
+def _get_kit_facts(kit):
+    """
+    Get facts from a kit
+
+    :param kit: A kit from which facts are going to be extracted
+    :return: A dictionary with a bunch of scavenged variables
+    """
+
+    facts = {}
 
     # Kit index variables are taken as well as facts
     # so they can be referenced by other variables, also
@@ -317,13 +462,64 @@ def _get_facts(*, kit=None):
     if kit is not None:
         for key, value in kit.index_data.items():
             _create_fact(facts, key, value, prefix="{}_{}".format(pkg_name, "kit"))
-
-    # Give those variables already!
     return facts
 
 
 @autolog
-def get_user_vars(*, user_var_files=None, kit=None, defaults_only=False):
+def _scan_fact_refs(*, var_files, kit=None):
+    """
+    Find out which facts are referenced
+
+    Variable files, templates and the kit index are scanned for
+    anything that looks like a fact name, no matter where it is.
+
+    :param var_files: variable search path
+    :param kit: Kit whose index and templates are going to be scanned
+    :returns: a set of fact names
+    """
+
+    fact_refs = set()
+
+    # Kit index: its values become variables as well (see _get_kit_facts)
+    if kit is not None:
+        pending = [kit.index_data]
+        while pending:
+            value = pending.pop()
+            if isinstance(value, str):
+                fact_refs.update(REGEX_FACT.findall(value))
+            elif isinstance(value, dict):
+                pending.extend(value.values())
+            elif isinstance(value, list):
+                pending.extend(value)
+
+    # Variable files
+    for var_file in _iter_search_path(var_files):
+        try:
+            file_data, _ = _read_file(var_file)
+            fact_refs.update(REGEX_FACT.findall(file_data.decode('utf-8')))
+        except (OSError, UnicodeDecodeError):
+            pass
+
+    # Templates, from both the kit and the user's templates directory
+    template_dirs = [os.path.join(util.get_data_home(), 'templates')]
+    if kit is not None:
+        for template_data in kit.templates.values():
+            template_dirs.extend(template_data['include'])
+    template_loader = renderer.get_template_loader(sorted(set(template_dirs)))
+    for template_name in template_loader.list_templates():
+        try:
+            source, _, _ = template_loader.get_source(None, template_name)
+            fact_refs.update(REGEX_FACT.findall(source))
+        except (jinja2.TemplateNotFound, UnicodeDecodeError):
+            pass
+
+    return fact_refs
+
+
+@autolog
+def get_user_vars(*, user_var_files=None, kit=None, defaults_only=False,
+                  use_cache=True, refresh_facts=False, lazy_facts=False,
+                  jobs=1):
     """
     Resolve variables from user environment
 
@@ -336,85 +532,306 @@ def get_user_vars(*, user_var_files=None, kit=None, defaults_only=False):
     :param user_var_files: Variable search paths set by the user
     :param kit: Kit to be sourced
     :param defaults_only: If True, variable locations set by the user won't be included.
+    :param use_cache:
+        If True, resolved variables are taken from cache as long as
+        none of their inputs have changed since they were resolved.
+    :param refresh_facts: If True, cached facts are gathered all over again
+    :param lazy_facts:
+        If True, only facts referenced by either variable files or
+        the kit templates get to be gathered.
+    :param jobs:
+        Number of processes variables are resolved on. Their pool
+        only gets started if variables are not taken from cache.
+    """
+
+    return get_kits_vars(
+        kits=[kit],
+        user_var_files=user_var_files,
+        defaults_only=defaults_only,
+        use_cache=use_cache,
+        refresh_facts=refresh_facts,
+        lazy_facts=lazy_facts,
+        jobs=jobs,
+    )[0]
+
+
+def _load_kit(kit):
+    """Get a Kit out of either a kit name or a Kit"""
+
+    if kit is None or isinstance(kit, Kit):
+        return kit
+    if isinstance(kit, str):
+        return get_kit(kit)
+    raise TypeError("kit must be either a str or a Kit")
+
+
+@autolog
+def get_kits_vars(*, kits, user_var_files=None, defaults_only=False,
+                  use_cache=True, refresh_facts=False, lazy_facts=False,
+                  jobs=1):
+    """
+    Resolve variables from user environment for a bunch of kits
+
+    This is the same as calling get_user_vars once per kit, except that
+    facts and variables from locations shared by all kits (that is,
+    all but kit defaults) are only gathered once.
+
+    :param kits: Kits to be sourced
+    :param user_var_files: Variable search paths set by the user
+    :param defaults_only: If True, variable locations set by the user won't be included.
+    :param use_cache:
+        If True, resolved variables are taken from cache as long as
+        none of their inputs have changed since they were resolved.
+    :param refresh_facts: If True, cached facts are gathered all over again
+    :param lazy_facts:
+        If True, only facts referenced by either variable files or
+        the kit templates get to be gathered.
+    :param jobs:
+        Number of processes variables are resolved on. Their pool
+        only gets started if variables are not taken from cache.
+    :returns: A list with resolved variables for each kit, in the same order
     """
 
     # user var locations can be None
     if user_var_files is None:
         user_var_files = []
 
-    # Kit variables directory
-    kit_var_dir = None
-
-    # Get kit (if any)
-    if kit is not None:
-        if isinstance(kit, str):
-            kit = get_kit(kit)
-        elif not isinstance(kit, Kit):
-            raise TypeError("kit must be either a str or a Kit")
-
-        # Where is that kit's variable directory?
-        kit_var_dir = kit.var_dir
-
-    #######################################################
-    # User variables get initialised with default variables
-    #######################################################
-    user_vars = _get_default_vars()
-    user_var_locations = {}
-    # set locations
-    for user_var in user_vars.keys():
-        user_var_locations[user_var] = None
+    # Get kits (if any)
+    kits = [_load_kit(kit) for kit in kits]
 
     ##########################
     # Get variable search path
     ##########################
-    user_var_files = _resolve_search_path(
-        user_var_files=user_var_files,
-        kit_var_dir=kit_var_dir,
+
+    # These locations are shared by all kits
+    shared_var_files = _resolve_search_path(
+        user_var_files=list(user_var_files),
         defaults_only=defaults_only
     )
-    log.msg_debug("Variables search path:")
-    log.msg_debug("**********************")
-    for user_var_file in user_var_files:
-        log.msg_debug(user_var_file)
-    log.msg_debug("**********************")
+
+    # ... while these ones include each kit's variables directory
+    kits_var_files = []
+    for kit in kits:
+        kit_var_files = _resolve_search_path(
+            user_var_files=list(user_var_files),
+            kit_var_dir=kit.var_dir if kit is not None else None,
+            defaults_only=defaults_only
+        )
+        kits_var_files.append(kit_var_files)
+
+        log.msg_debug("Variables search path:")
+        log.msg_debug("**********************")
+        for user_var_file in kit_var_files:
+            log.msg_debug(user_var_file)
+        log.msg_debug("**********************")
 
     ########################################
-    # Set facts
+    # Set facts (once for all kits)
     ########################################
-    facts = _get_facts(kit=kit)
-    fact_locations = {}
-    for fact in facts.keys():
-        fact_locations[fact] = 'fact'
-    user_vars.update(facts)
-    user_var_locations.update(fact_locations)
-
-    ######################################################
-    # Obtain variables from variable files set by the user
-    ######################################################
-    _vars, locations = _get_vars(var_files=user_var_files)
-    user_vars.update(_vars)
-
-    # Variables whose values are strings may
-    # have jinja2 logic within them as well
-    # so we render those values through jinja
-    # so, we merge defaults and facts with
-    # user-set values to get the final picture
-    user_vars.update(renderer.render_dict(**user_vars))
-
-    # and we consolidate their locations (should they come from actual files)
-    user_var_locations.update(locations)
-
-    # Print vars
-    _list_vars(vars=user_vars, locations=user_var_locations)
+    fact_names = None
+    if lazy_facts:
+        fact_names = set()
+        for kit, kit_var_files in zip(kits, kits_var_files):
+            fact_names.update(_scan_fact_refs(var_files=kit_var_files, kit=kit))
+    facts = _get_facts(refresh=refresh_facts, names=fact_names)
+
+    # Variables from shared locations are read only once,
+    # the first time they're needed.
+    shared_vars = None
+
+    # Pool of processes variables are resolved on, it gets
+    # started the first time variables aren't taken from cache
+    executor = None
+
+    kits_vars = []
+    try:
+        for kit, kit_var_files in zip(kits, kits_var_files):
+
+            #######################################################
+            # User variables get initialised with default variables
+            #######################################################
+            user_vars = _get_default_vars()
+            user_var_locations = {}
+            # set locations
+            for user_var in user_vars.keys():
+                user_var_locations[user_var] = None
+
+            # Facts, including those taken from the kit index
+            kit_facts = dict(facts)
+            kit_facts.update(_get_kit_facts(kit))
+            for fact in kit_facts.keys():
+                user_var_locations[fact] = 'fact'
+            user_vars.update(kit_facts)
+
+            ##################################################
+            # Resolved variables are cached across runs, they
+            # are reused as long as their inputs (variable files,
+            # defaults, facts and kit index) stay the same.
+            ##################################################
+            if use_cache:
+                cache_slot = cache.get_digest(kit_var_files)
+                cache_key = cache.get_digest(
+                    pkg_version,
+                    _get_search_path_fingerprint(kit_var_files),
+                    kit.index_data if kit is not None else None,
+                    user_vars,
+                )
+                cached_vars = cache.load(cache.CACHE_VARS, cache_slot, cache_key)
+                if cached_vars is not None:
+                    log.msg_debug("Variables have been taken from cache")
+                    user_vars, user_var_locations = cached_vars
+                    _list_vars(vars=user_vars, locations=user_var_locations)
+                    kits_vars.append(user_vars)
+                    continue
+
+            ######################################################
+            # Obtain variables from variable files set by the user
+            ######################################################
+            if shared_vars is None:
+                shared_vars = _get_vars(var_files=shared_var_files)
+
+            # Kit defaults come first, since they have the lowest precedence
+            _vars, locations = _get_vars(var_files=[
+                var_file for var_file in kit_var_files
+                if var_file not in shared_var_files
+            ])
+
+            # Shared variables get resolved in place
+            # hence the reason why each kit gets its own copy.
+            _vars.update(deepcopy(shared_vars[0]))
+            locations.update(shared_vars[1])
+            user_vars.update(_vars)
+
+            # Variables whose values are strings may
+            # have jinja2 logic within them as well
+            # so we render those values through jinja
+            # so, we merge defaults and facts with
+            # user-set values to get the final picture
+            if executor is None and jobs > 1:
+                executor = ProcessPoolExecutor(max_workers=jobs)
+            user_vars.update(renderer.render_vars(user_vars, executor=executor))
+
+            # and we consolidate their locations (should they come from actual files)
+            user_var_locations.update(locations)
+
+            # Save them for the next run
+            if use_cache:
+                cache.store(
+                    cache.CACHE_VARS, cache_slot, cache_key,
+                    (user_vars, user_var_locations)
+                )
+
+            # Print vars
+            _list_vars(vars=user_vars, locations=user_var_locations)
+
+            kits_vars.append(user_vars)
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
     # Give variables already!
-    return user_vars
+    return kits_vars
+
+
+def _iter_search_path(var_files):
+    """
+    Iterate over all files found along a variable search path
+
+    :param var_files: list of files/directories, as taken by _get_vars
+    :returns: a generator of full paths to files
+    """
+
+    for var_file in var_files:
+        var_file = os.path.abspath(var_file)
+
+        # Directories within archive kits
+        archive_path = archive.split_path(var_file)
+        if archive_path is not None:
+            kit_archive, member = archive_path
+            if kit_archive.is_dir(member):
+                yield from archive.list_files(var_file)
+            else:
+                yield var_file
+            continue
+
+        try:
+            # File types are taken from directory entries,
+            # there's no need to stat each file
+            with os.scandir(var_file) as entries:
+                next_var_files = sorted(
+                    entry.path for entry in entries if entry.is_file()
+                )
+        except OSError:
+            # Not a directory (it may not even exist)
+            yield var_file
+        else:
+            yield from next_var_files
+
+
+@autolog
+def _get_search_path_fingerprint(var_files):
+    """
+    Get fingerprints of all files found along a variable search path
+
+    :param var_files: list of files/directories, as taken by _get_vars
+    :returns: a list of file fingerprints
+    """
+
+    return list(_map_var_files(
+        _get_file_fingerprint, list(_iter_search_path(var_files))
+    ))
+
+
+def _get_file_fingerprint(var_file):
+    """Get the fingerprint of a file, which may be within an archive"""
+
+    if archive.split_path(var_file) is not None:
+        return archive.get_file_fingerprint(var_file)
+    return cache.get_file_fingerprint(var_file)
+
+
+def _read_file(var_file):
+    """
+    Read a file, which may be within an archive
+
+    :param var_file: full path to the file
+    :returns:
+        a tuple with the file contents (bytes) and both
+        modification time and size of either the file or its archive
+    """
+
+    if archive.split_path(var_file) is not None:
+        return archive.read_file(var_file)
+
+    with open(var_file, 'rb') as f:
+        file_stat = os.fstat(f.fileno())
+        return f.read(), (file_stat.st_mtime, file_stat.st_size)
+
+
+def _map_var_files(func, var_files):
+    """
+    Apply a function on a bunch of variable files at once
+
+    :param func: function taking the full path to a file
+    :param var_files: list of files
+    :returns: an iterator of results, in the same order as var_files
+    """
+
+    if len(var_files) <= 1:
+        return map(func, var_files)
+    max_workers = min(VAR_FILES_MAX_WORKERS, len(var_files))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(func, var_files))
 
 
 @autolog
 def _list_vars(*, vars, locations):
     """Print all vars given"""
 
+    # Nobody is going to see them anyway
+    if not log.is_enabled(log.LOG_LEVEL_INFO):
+        return
+
     log.msg("{} variable(s) captured".format(len(vars)))
     log.msg("**********************************")
     for key, value in sorted(vars.items()):
@@ -434,6 +851,57 @@ def _list_vars(*, vars, locations):
     log.msg("**********************************")
 
 
+def _load_var_file(var_file):
+    """
+    Load a variable file
+
+    Parsed documents are kept on cache, keyed by
+    path, modification time, size and content hash,
+    so files are only parsed again once they've changed.
+
+    :param var_file: full path to the variable file
+    :returns: the parsed YAML document
+    """
+
+    file_data, (file_mtime, file_size) = _read_file(var_file)
+
+    cache_slot = cache.get_digest(var_file)
+    cache_key = (file_mtime, file_size, hashlib.sha1(file_data).hexdigest())
+    vars = cache.load(cache.CACHE_YAML, cache_slot, cache_key)
+    if vars is None:
+        vars = util.yaml_load(file_data)
+        cache.store(cache.CACHE_YAML, cache_slot, cache_key, vars)
+    return vars
+
+
+def _read_var_file(var_file):
+    """
+    Read variables from a variable file
+
+    :param var_file: full path to the variable file
+    :returns: a dictionary with its variables, None if it can't be used
+    """
+
+    try:
+        # Load the YAML file
+        vars = _load_var_file(var_file)
+    except FileNotFoundError:
+        log.msg_debug("{}: not found", var_file)
+        return None
+    except (OSError, yaml.YAMLError):
+        log.msg_err("Error loading variable file: {}".format(var_file))
+        log.msg_err("{}: file discarded".format(var_file))
+        return None
+
+    # Check whether there is indeed something inside the YAML file
+    if not isinstance(vars, dict):
+        log.msg_err("Invalid document format on file '{}'. "
+            "Root YAML structure must be a dictionary. "
+            "This file has been discarded.".format(var_file))
+        return None
+    return vars
+
+
 @autolog
 def _get_vars(*, var_files):
     """
@@ -452,71 +920,28 @@ def _get_vars(*, var_files):
     tpl_vars = {}  # variables themselves
     tpl_files = {}  # locations in which these vars were set will go in here
 
-    #############################################################
-    # iterate through all entries and see whether or not they're
-    # files or directories
-    #############################################################
-    for var_file in var_files:
-
-        # Normalize full path to file
-        var_file = os.path.abspath(var_file)
-
-        ###############################################################
-        # The entry is in fact a file, thus, to load it directly I must
-        # Only files with .yaml and .yml will be taken into account
-        ###############################################################
-        # The entry is in fact a file, thus, to load it directly I must
-        if os.path.isfile(var_file) and \
-        re.match("/.*\.yaml$", var_file) or re.match("/.*\.yml$", var_file):
-            with open(var_file, 'r') as f:
-                # Update variables with those found
-                # on this file
-                try:
-
-                    # Load the YAML file
-                    vars = yaml.load(f)
-
-                    # Check whether there is indeed something inside the YAML file
-                    if not isinstance(vars, dict):
-                        log.msg_err("Invalid document format on file '{}'. "
-                            "Root YAML structure must be a dictionary. "
-                            "This file has been discarded.".format(var_file))
-                        continue
-
-                    # And update locations in which these
-                    # variables were found
-                    tpl_vars.update(vars)
-
-                    for var in vars.keys():
-                        tpl_files[var] = var_file
-
-                    # Log the count
-                    log.msg_debug("Found {} variable(s) in {}".format(
-                        len(vars), var_file)
-                    )
-                except yaml.YAMLError as exc:
-                    log.msg_err("Error loading variable file: {}".format(
-                        var_file)
-                    )
-                    log.msg_err("{}: file discarded".format(var_file))
-
-        # The entry is a directory
-        elif os.path.isdir(var_file):
-
-            # First of all, list all files inside of this directory
-            # and merge their values with tpl_vars
-            next_var_files = []
-            for next_var_file in os.listdir(var_file):
-                next_var_file = os.path.join(var_file, next_var_file)
-                if os.path.isfile(next_var_file):
-                    next_var_files.append(next_var_file)
-
-            # Get both variables and locations
-            vars, files = _get_vars(var_files=next_var_files)
-
-            # ... and merge them with the current
-            tpl_vars.update(vars)
-            tpl_files.update(files)
+    ################################################################
+    # Only files with .yaml and .yml will be taken into account,
+    # either set directly or found inside directories.
+    # They are loaded all at once, yet merged following precedence
+    ################################################################
+    var_files = [
+        var_file for var_file in _iter_search_path(var_files)
+        if var_file.endswith(('.yaml', '.yml'))
+    ]
+    for var_file, vars in zip(var_files, _map_var_files(_read_var_file, var_files)):
+        if vars is None:
+            continue
+
+        # Update variables with those found on this file
+        # and update locations in which these
+        # variables were found
+        tpl_vars.update(vars)
+        for var in vars.keys():
+            tpl_files[var] = var_file
+
+        # Log the count
+        log.msg_debug("Found {} variable(s) in {}", len(vars), var_file)
 
     # Return the final result
     return tpl_vars, tpl_files
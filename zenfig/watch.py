@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+"""
+zenfig.watch
+~~~~~~~~
+
+File system watcher
+
+:copyright: (c) 2016 by Alejandro Ricoveri
+:license: MIT, see LICENSE for more details.
+
+"""
+
+import os
+from time import sleep
+
+from . import log
+from .kits import archive
+
+# inotify is used whenever it is available,
+# otherwise, watched paths are polled
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+# Time (in seconds) between polls
+WATCH_POLL_INTERVAL = 1.0
+
+# Time (in seconds) changes are collected before being reported
+WATCH_DEBOUNCE = 0.3
+
+
+def _snapshot(paths):
+    """
+    Take a snapshot of a bunch of files and directories
+
+    :param paths: list of files/directories
+    :returns:
+        a dictionary whose keys are full paths to files
+        and values are both their modification time and size
+    """
+
+    snapshot = {}
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                for filename in files:
+                    file_path = os.path.join(root, filename)
+                    try:
+                        file_stat = os.stat(file_path)
+                    except OSError:
+                        continue
+                    snapshot[file_path] = (file_stat.st_mtime, file_stat.st_size)
+        else:
+            try:
+                file_stat = os.stat(path)
+                snapshot[path] = (file_stat.st_mtime, file_stat.st_size)
+            except OSError:
+                pass
+    return snapshot
+
+
+def _get_changes(old_snapshot, new_snapshot):
+    """Get all paths that differ between two snapshots"""
+
+    return set(
+        path for path in set(old_snapshot) | set(new_snapshot)
+        if old_snapshot.get(path) != new_snapshot.get(path)
+    )
+
+
+def _get_watch_dirs(paths):
+    """
+    Get all directories to be watched through inotify
+
+    :param paths: list of files/directories
+    :returns: a set of directories
+    """
+
+    watch_dirs = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                watch_dirs.add(root)
+
+        # Files (and paths yet to exist) are
+        # watched through their parent directory
+        elif os.path.isdir(os.path.dirname(path)):
+            watch_dirs.add(os.path.dirname(path))
+    return watch_dirs
+
+
+def _watch_inotify(paths, *, debounce):
+    """Watch paths through inotify"""
+
+    flags = inotify_simple.flags
+    watch_flags = flags.CREATE | flags.DELETE | flags.MODIFY | \
+        flags.MOVED_FROM | flags.MOVED_TO | flags.CLOSE_WRITE | \
+        flags.DELETE_SELF
+
+    with inotify_simple.INotify() as inotify:
+        while True:
+            # Directories could have been created since the last time
+            for watch_dir in _get_watch_dirs(paths):
+                try:
+                    inotify.add_watch(watch_dir, watch_flags)
+                except OSError:
+                    pass
+
+            # Once something happens, events are collected
+            # for as long as the debounce time
+            if inotify.read(read_delay=int(debounce * 1000)):
+                yield
+
+
+def _watch_poll(paths, *, interval, debounce):
+    """Watch paths by polling them"""
+
+    # Changes happening while the caller does its thing
+    # are caught on the next round since snapshots are kept
+    snapshot = _snapshot(paths)
+    while True:
+        sleep(interval)
+        new_snapshot = _snapshot(paths)
+        changes = _get_changes(snapshot, new_snapshot)
+        if not changes:
+            continue
+
+        # Wait for things to settle down
+        while changes:
+            snapshot = new_snapshot
+            sleep(debounce)
+            new_snapshot = _snapshot(paths)
+            changes = _get_changes(snapshot, new_snapshot)
+        yield
+
+
+def _get_watch_path(path):
+    """Paths within archive kits are watched through their archive"""
+
+    archive_path = archive.split_path(path)
+    if archive_path is not None:
+        return archive_path[0].path
+    return path
+
+
+def watch(paths, *, interval=WATCH_POLL_INTERVAL, debounce=WATCH_DEBOUNCE):
+    """
+    Watch a bunch of files and directories
+
+    A generator is given back, it yields each time something
+    changes on any of the given paths, changes happening
+    close enough in time are reported only once.
+
+    :param paths: list of files/directories to be watched
+    :param interval: time (in seconds) between polls (if polling)
+    :param debounce: time (in seconds) changes are collected
+    """
+
+    paths = sorted(set(
+        _get_watch_path(os.path.abspath(path)) for path in paths
+    ))
+
+    log.msg_debug("Watching:")
+    log.msg_debug("*********************")
+    for path in paths:
+        log.msg_debug(path)
+    log.msg_debug("*********************")
+
+    if inotify_simple is not None:
+        return _watch_inotify(paths, debounce=debounce)
+
+    log.msg_debug("inotify is not available, polling instead")
+    return _watch_poll(paths, interval=interval, debounce=debounce)